@@ -0,0 +1,155 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+from typing import Dict, List, Tuple
+
+from metrics import ADMISSION_REJECTIONS, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Upstream generations allowed at once (0 disables admission control), how
+# many more may wait for a slot, and for how long before giving up
+OLLAMA_MAX_CONCURRENT = int(os.getenv("OLLAMA_MAX_CONCURRENT", "4"))
+OLLAMA_MAX_QUEUE = int(os.getenv("OLLAMA_MAX_QUEUE", "32"))
+OLLAMA_QUEUE_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "30"))
+
+# Priority classes, lowest value served first. Book-only answers (book_rag)
+# never need a generation slot, so they bypass the queue entirely.
+PRIORITY_INTERACTIVE = 0  # single /ask requests
+PRIORITY_BATCH = 1  # /ask/batch items
+
+# Initial guess for how long a generation holds its slot, refined as they finish
+INITIAL_HOLD_SECONDS = 5.0
+HOLD_SMOOTHING = 0.2
+
+
+class AdmissionError(Exception):
+    """A request that was shed instead of queued; maps to 429/503 with Retry-After"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded priority wait queue.
+
+    A freed slot is handed straight to the best waiter (lowest priority value,
+    then arrival order). When the queue is full new requests are rejected with
+    429; a request that waits longer than queue_timeout gets 503. Both carry a
+    Retry-After estimated from recent generation times and the queue depth.
+    """
+
+    def __init__(self, max_concurrent: int = OLLAMA_MAX_CONCURRENT, max_queue: int = OLLAMA_MAX_QUEUE,
+                 queue_timeout: float = OLLAMA_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.sequence = itertools.count()
+        self.hold_seconds = INITIAL_HOLD_SECONDS
+        self.admitted = 0
+        self.queued_total = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds_total = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self.waiters if not future.done())
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free for a newcomer"""
+        if not self.enabled:
+            return 1
+        return max(1, math.ceil(self.hold_seconds * (self.queued + 1) / self.max_concurrent))
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE) -> float:
+        """Wait for a slot; returns the admission time to pass back to release()"""
+        if not self.enabled:
+            return time.perf_counter()
+        if self.active < self.max_concurrent and not self.queued:
+            self.active += 1
+            self.admitted += 1
+            return time.perf_counter()
+
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            ADMISSION_REJECTIONS.inc(reason="queue_full")
+            raise AdmissionError(429, "Too many requests waiting for the model, try again later", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.sequence), future))
+        self.queued_total += 1
+        started = time.perf_counter()
+        try:
+            # Not wait_for: before Python 3.12 it swallows a cancellation that
+            # arrives after the slot was handed over, admitting a caller that left
+            await asyncio.wait((future,), timeout=self.queue_timeout)
+            if not future.done():
+                future.cancel()
+                self.timed_out += 1
+                ADMISSION_REJECTIONS.inc(reason="queue_timeout")
+                raise AdmissionError(503, "Timed out waiting for the model, try again later", self.retry_after())
+        except asyncio.CancelledError:
+            # The slot may have been handed over just as the caller went away
+            if future.done() and not future.cancelled():
+                self.release(time.perf_counter())
+            else:
+                future.cancel()
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.wait_seconds_total += waited
+            STAGE_SECONDS.observe(waited, stage="queue_wait")
+            self._prune()
+
+        self.admitted += 1
+        return time.perf_counter()
+
+    def release(self, admitted_at: float):
+        """Free a slot taken with acquire(), passing it on to the next waiter"""
+        if not self.enabled:
+            return
+        held = time.perf_counter() - admitted_at
+        self.hold_seconds += HOLD_SMOOTHING * (held - self.hold_seconds)
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)  # the slot changes hands; active stays the same
+                return
+        self.active -= 1
+
+    def _prune(self):
+        """Drop timed out or cancelled waiters from the top of the heap"""
+        while self.waiters and self.waiters[0][2].done():
+            heapq.heappop(self.waiters)
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'max_concurrent': self.max_concurrent,
+            'active': self.active,
+            'queued': self.queued,
+            'max_queue': self.max_queue,
+            'queue_timeout': self.queue_timeout,
+            'admitted': self.admitted,
+            'queued_total': self.queued_total,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'avg_wait_ms': self.wait_seconds_total / self.queued_total * 1000 if self.queued_total else 0.0,
+            'avg_generation_s': self.hold_seconds,
+            'retry_after': self.retry_after(),
+        }
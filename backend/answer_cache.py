@@ -0,0 +1,155 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_DB = os.getenv("ANSWER_CACHE_DB", "")  # empty disables the disk tier
+
+
+def normalize_question(question: str) -> str:
+    """Fold case, whitespace and trailing punctuation so trivial variants share a key"""
+    return re.sub(r'\s+', ' ', question.lower()).strip().rstrip('?!. ')
+
+
+def make_cache_key(question: str, route: str, model: str, corpus_version: str = "", preset: str = "") -> str:
+    """Key on the normalized question, the answer route (see /ask), the model, the book corpus and latency preset"""
+    return json.dumps([normalize_question(question), route, model, corpus_version, preset])
+
+
+class AnswerCache:
+    """
+    Two-tier answer cache: an in-memory LRU with TTL, optionally backed by a
+    SQLite table so entries survive restarts. Disk access runs in a thread.
+    """
+
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 db_path: str = ANSWER_CACHE_DB):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.db = None
+        self.db_lock = threading.Lock()
+        if db_path and max_size > 0:
+            self.open_db(db_path)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def open_db(self, db_path: str):
+        try:
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self.db.commit()
+            logger.info(f"💾 Answer cache disk tier at {db_path}")
+        except sqlite3.Error as e:
+            logger.warning(f"Answer cache disk tier disabled: {e}")
+            self.db = None
+
+    def _remember(self, key: str, value: Dict, expires_at: float):
+        self.entries[key] = (value, expires_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _db_get(self, key: str) -> Optional[tuple]:
+        with self.db_lock:
+            row = self.db.execute(
+                "SELECT value, expires_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def _db_set(self, key: str, value: Dict, expires_at: float):
+        with self.db_lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO answers (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+            self.db.execute("DELETE FROM answers WHERE expires_at < ?", (time.time(),))
+            self.db.commit()
+
+    async def get(self, key: str) -> Optional[Dict]:
+        """Return the cached response dict for key, or None"""
+        if not self.enabled:
+            return None
+        with STAGE_SECONDS.time(stage="cache_lookup"):
+            return await self._get(key)
+
+    async def _get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+
+        if self.db is not None:
+            try:
+                entry = await asyncio.get_running_loop().run_in_executor(None, self._db_get, key)
+            except sqlite3.Error as e:
+                logger.warning(f"Answer cache read failed: {e}")
+                entry = None
+            if entry is not None and entry[1] > now:
+                self._remember(key, entry[0], entry[1])
+                self.disk_hits += 1
+                return entry[0]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Dict):
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        if self.db is not None:
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._db_set, key, value, expires_at
+                )
+            except sqlite3.Error as e:
+                logger.warning(f"Answer cache write failed: {e}")
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'disk_tier': self.db is not None,
+        }
+
+    def close(self):
+        if self.db is not None:
+            with self.db_lock:
+                self.db.close()
+            self.db = None
@@ -0,0 +1,113 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from benchmarks.common import BACKEND_DIR, print_summary, save_results, summarize
+from benchmarks.synthetic_corpus import generate_corpus
+
+QUERIES = [
+    "How do I write a function?",
+    "What is a list?",
+    "show me an example of a loop over a dictionary",
+    "class method example",
+    "how to print a string",
+    "variables and values",
+    "read lines from a file",
+    "what errors can a test return",
+    "python module import",
+    "user input number",
+]
+
+
+def time_calls(fn: Callable, iterations: int) -> List[float]:
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def run(chapters: int, words: int, code_ratio: float, iterations: int, build_repeats: int, workdir: str) -> Dict:
+    chapters_dir = os.path.join(workdir, "data", "chapters")
+    print(f"📚 Generating {chapters} chapters of ~{words} words in {chapters_dir}")
+    generate_corpus(chapters_dir, chapters, words, code_ratio)
+    # simple_rag resolves data/chapters and the snapshot path against the cwd
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+    from book_index import BookIndex
+    from simple_rag import SNAPSHOT_PATH, SimpleBookRAG
+
+    results = {}
+    rag = SimpleBookRAG()
+    loaded = rag.load_chapters()
+    sources = rag.scan_sources()
+
+    results['index_build'] = summarize(time_calls(lambda i: BookIndex.build(loaded), build_repeats))
+    index = BookIndex.build(loaded)
+    results['snapshot_save'] = summarize(time_calls(lambda i: index.save(SNAPSHOT_PATH, sources), build_repeats))
+    results['snapshot_load'] = summarize(time_calls(lambda i: BookIndex.load(SNAPSHOT_PATH, sources), build_repeats))
+
+    def cold_start(i):
+        os.remove(SNAPSHOT_PATH)
+        SimpleBookRAG().initialize()
+    results['initialize_cold'] = summarize(time_calls(cold_start, build_repeats))
+    results['initialize_warm'] = summarize(time_calls(lambda i: SimpleBookRAG().initialize(), build_repeats))
+
+    rag.initialize()
+    count = len(QUERIES)
+    for name, fn in (
+        ('search_chapters', lambda i: rag.search_chapters(QUERIES[i % count], top_k=5)),
+        ('find_best_snippet', lambda i: rag.find_best_snippet(i % rag.index.doc_count, QUERIES[i % count])),
+        ('retrieve_context', lambda i: rag.retrieve_context(QUERIES[i % count])),
+        ('answer', lambda i: rag.answer(QUERIES[i % count])),
+    ):
+        started = time.perf_counter()
+        samples = time_calls(fn, iterations)
+        results[name] = summarize(samples, time.perf_counter() - started)
+
+    def reload_one(i):
+        path = os.path.join(chapters_dir, loaded[i % len(loaded)]['filename'])
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(f"\nAn extra line number {i} about functions and lists.\n")
+        rag.reload()
+    results['reload_one_chapter'] = summarize(time_calls(reload_one, build_repeats))
+
+    results['corpus'] = {
+        'chapters': index.doc_count,
+        'terms': len(index.terms),
+        'passages': len(index.passage_lengths),
+        'text_bytes': len(index.text_blob),
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark index build, search and snippet extraction")
+    parser.add_argument("--chapters", type=int, default=100)
+    parser.add_argument("--words", type=int, default=3000, help="prose words per chapter")
+    parser.add_argument("--code-ratio", type=float, default=0.25)
+    parser.add_argument("--iterations", type=int, default=500, help="calls per query benchmark")
+    parser.add_argument("--build-repeats", type=int, default=5)
+    parser.add_argument("--workdir", default=None, help="where to generate the corpus (default: a temp dir)")
+    parser.add_argument("--output", default=None, help="results JSON path (default: benchmarks/results/)")
+    args = parser.parse_args()
+
+    params = {key: value for key, value in vars(args).items() if key not in ('workdir', 'output')}
+    workdir = args.workdir or tempfile.mkdtemp(prefix="askafrica-bench-")
+    output = os.path.abspath(args.output) if args.output else None
+    results = run(args.chapters, args.words, args.code_ratio, args.iterations, args.build_repeats, workdir)
+
+    print("\n📊 RAG micro-benchmarks")
+    for name, summary in results.items():
+        if name != 'corpus':
+            print_summary(name, summary)
+    print(f"  corpus: {results['corpus']}")
+    save_results("bench_rag", params, results, output)
+
+
+if __name__ == "__main__":
+    main()
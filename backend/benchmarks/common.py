@@ -0,0 +1,71 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of samples (0 when there are none)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples: List[float], elapsed: float = None) -> Dict:
+    """Latency summary in milliseconds, plus throughput when elapsed is given"""
+    summary = {
+        'count': len(samples),
+        'mean_ms': sum(samples) / len(samples) * 1000 if samples else 0.0,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'max_ms': max(samples) * 1000 if samples else 0.0,
+    }
+    if elapsed:
+        summary['per_second'] = len(samples) / elapsed
+    return summary
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def save_results(name: str, params: Dict, results: Dict, output: str = None) -> str:
+    """Write a run to JSON with enough context to compare it with later runs"""
+    run = {
+        'benchmark': name,
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': params,
+        'results': results,
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(run, f, indent=2)
+    print(f"💾 Results saved to {output}")
+    return output
+
+
+def print_summary(label: str, summary: Dict):
+    rate = f", {summary['per_second']:.1f}/s" if 'per_second' in summary else ""
+    print(f"  {label:<28} n={summary['count']:<6} p50={summary['p50_ms']:.2f}ms "
+          f"p95={summary['p95_ms']:.2f}ms p99={summary['p99_ms']:.2f}ms{rate}")
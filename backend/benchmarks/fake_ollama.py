@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+EMBED_DIM = 64
+
+DEFAULT_CONFIG = {
+    'latency': 0.05,       # seconds before the first token (prompt evaluation)
+    'jitter': 0.2,         # +/- fraction applied to latency and token pacing
+    'token_rate': 200.0,   # generated tokens per second (0 = as fast as possible)
+    'tokens': 64,          # tokens per answer
+    'load_time': 0.0,      # extra delay on the first request, reported as load_duration
+    'error_rate': 0.0,     # share of generations that fail
+    'error_mode': "http",  # "http" (500 before streaming) or "stream" (error chunk mid-answer)
+    'seed': 1,
+}
+
+
+def create_app(config: Dict = None) -> FastAPI:
+    """A stand-in for Ollama's HTTP API with configurable latency, pacing and failures"""
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    rng = random.Random(config['seed'])
+    state = {'requests': 0, 'active': 0, 'max_active': 0, 'errors': 0, 'loaded': False}
+    app = FastAPI(title="Fake Ollama")
+
+    def jittered(value: float) -> float:
+        return max(0.0, value * (1 + rng.uniform(-config['jitter'], config['jitter'])))
+
+    def final_chunk(model: str, prompt: str, context: list, tokens: int, started: float, load_seconds: float,
+                    prompt_seconds: float) -> Dict:
+        total = time.perf_counter() - started
+        # Like Ollama: the incoming context plus this turn's prompt and answer tokens
+        prompt_tokens = [len(word) for word in prompt.split()]
+        return {
+            'model': model,
+            'created_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            'response': "",
+            'done': True,
+            'context': context + prompt_tokens + [0] * tokens,
+            'total_duration': int(total * 1e9),
+            'load_duration': int(load_seconds * 1e9),
+            'prompt_eval_count': max(1, len(prompt) // 4),
+            'prompt_eval_duration': int(prompt_seconds * 1e9),
+            'eval_count': tokens,
+            'eval_duration': int(max(total - load_seconds - prompt_seconds, 1e-6) * 1e9),
+        }
+
+    async def generate_chunks(body: Dict, fail_at: int):
+        model = body.get('model', "fake")
+        prompt = body.get('prompt', "")
+        started = time.perf_counter()
+        load_seconds = 0.0
+        if not state['loaded']:
+            state['loaded'] = True
+            load_seconds = config['load_time']
+            await asyncio.sleep(load_seconds)
+        # Like Ollama: an empty prompt only loads the model
+        if not prompt:
+            yield final_chunk(model, prompt, [], 0, started, load_seconds, 0.0)
+            return
+        prompt_seconds = jittered(config['latency'])
+        await asyncio.sleep(prompt_seconds)
+
+        words = prompt.split() or ["answer"]
+        num_predict = body.get('options', {}).get('num_predict', -1)  # -1: no limit, as in Ollama
+        tokens = min(config['tokens'], num_predict) if num_predict > 0 else config['tokens']
+        for i in range(tokens):
+            if i == fail_at:
+                yield {'error': "fake ollama: injected failure"}
+                return
+            if config['token_rate'] > 0:
+                await asyncio.sleep(jittered(1.0 / config['token_rate']))
+            yield {'model': model, 'response': ("" if i == 0 else " ") + words[i % len(words)], 'done': False}
+        yield final_chunk(model, prompt, body.get('context') or [], tokens, started, load_seconds, prompt_seconds)
+
+    @app.get("/")
+    async def root():
+        return PlainTextResponse("Ollama is running")
+
+    @app.get("/api/tags")
+    async def tags():
+        return {'models': [{'name': "fake:latest", 'model': "fake:latest"}]}
+
+    @app.get("/_stats")
+    async def stats():
+        return state
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        state['requests'] += 1
+        fail_at = -1
+        if rng.random() < config['error_rate']:
+            state['errors'] += 1
+            if config['error_mode'] == "http":
+                return JSONResponse({'error': "fake ollama: injected failure"}, status_code=500)
+            fail_at = rng.randint(0, max(0, config['tokens'] - 1))
+
+        async def tracked():
+            state['active'] += 1
+            state['max_active'] = max(state['max_active'], state['active'])
+            try:
+                async for chunk in generate_chunks(body, fail_at):
+                    yield json.dumps(chunk) + "\n"
+            finally:
+                state['active'] -= 1
+
+        if body.get('stream', True):
+            return StreamingResponse(tracked(), media_type="application/x-ndjson")
+
+        chunks = [json.loads(line) async for line in tracked()]
+        if chunks and 'error' in chunks[-1]:
+            return JSONResponse(chunks[-1], status_code=500)
+        return {**chunks[-1], 'response': "".join(chunk.get('response', "") for chunk in chunks)}
+
+    def embed_text(text: str):
+        digest = hashlib.sha256(text.encode('utf-8')).digest()
+        return [(digest[i % len(digest)] - 128) / 128.0 for i in range(EMBED_DIM)]
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        texts = body.get('input', [])
+        if isinstance(texts, str):
+            texts = [texts]
+        return {'model': body.get('model', "fake"), 'embeddings': [embed_text(text) for text in texts]}
+
+    @app.post("/api/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        return {'embedding': embed_text(body.get('prompt', ""))}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    for key, value in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    import uvicorn
+    config = {key: getattr(args, key) for key in DEFAULT_CONFIG}
+    print(f"🤖 Fake Ollama on http://{args.host}:{args.port} with {config}")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.bench_rag import QUERIES
+from benchmarks.common import BACKEND_DIR, print_summary, save_results, summarize
+from benchmarks.fake_ollama import DEFAULT_CONFIG
+from benchmarks.synthetic_corpus import generate_corpus
+
+ROUTES = {
+    'ollama': {},
+    'book_rag': {'use_rag': True},
+    'rag_llm': {'use_rag': True, 'augment': True},
+}
+STARTUP_TIMEOUT = 60.0
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(url: str, process: subprocess.Popen):
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} during startup")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready in {STARTUP_TIMEOUT:.0f}s")
+
+
+def start_fake_ollama(port: int, config: Dict) -> subprocess.Popen:
+    command = [sys.executable, "-m", "benchmarks.fake_ollama", "--port", str(port)]
+    for key, value in config.items():
+        command += [f"--{key.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR)
+    wait_until_ready(f"http://127.0.0.1:{port}/", process)
+    return process
+
+
+def start_app(port: int, workdir: str, ollama_urls: List[str], workers: int, cache: bool,
+              env_overrides: Dict) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        'PYTHONPATH': BACKEND_DIR,
+        'OLLAMA_URL': ollama_urls[0],
+        'OLLAMA_URLS': ",".join(ollama_urls),
+        'OLLAMA_MODEL': "fake",
+        'ANSWER_CACHE_SIZE': os.environ.get('ANSWER_CACHE_SIZE', "1000") if cache else "0",
+        **env_overrides,
+    }
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=workdir, env=env)
+    wait_until_ready(f"http://127.0.0.1:{port}/health", process)
+    return process
+
+
+def pick_routes(requests: int, mix: Dict[str, float], seed: int) -> List[str]:
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    return [rng.choices(names, weights)[0] for _ in range(requests)]
+
+
+async def ask(client: httpx.AsyncClient, route: str, question: str, stream: bool) -> Dict:
+    body = {'question': question, 'stream': stream, **ROUTES[route]}
+    started = time.perf_counter()
+    first_token = None
+    try:
+        if not stream:
+            response = await client.post("/ask", json=body)
+            status = response.status_code
+        else:
+            status = 200
+            async with client.stream("POST", "/ask", json=body) as response:
+                status = response.status_code
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    if event.get('type') == "token" and first_token is None:
+                        first_token = time.perf_counter() - started
+                    elif event.get('type') == "error":
+                        status = 502  # failed after the stream started
+    except httpx.HTTPError as e:
+        status = f"client_error:{type(e).__name__}"
+    return {'route': route, 'status': status, 'latency': time.perf_counter() - started, 'first_token': first_token}
+
+
+async def run_load(app_url: str, routes: List[str], concurrency: int, stream: bool, unique_questions: int) -> Dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=300.0) as client:
+        async def one(i: int, route: str):
+            question = f"{QUERIES[i % len(QUERIES)]} ({i % unique_questions})"
+            async with semaphore:
+                return await ask(client, route, question, stream)
+
+        started = time.perf_counter()
+        samples = await asyncio.gather(*(one(i, route) for i, route in enumerate(routes)))
+        elapsed = time.perf_counter() - started
+        # Server-side stage breakdown for the same run
+        metrics = await client.get("/metrics")
+
+    results = {'elapsed_s': elapsed, 'overall': summarize([s['latency'] for s in samples], elapsed)}
+    statuses: Dict[str, int] = {}
+    for sample in samples:
+        statuses[str(sample['status'])] = statuses.get(str(sample['status']), 0) + 1
+    results['statuses'] = statuses
+    for route in sorted(set(routes)):
+        ok = [s for s in samples if s['route'] == route and s['status'] == 200]
+        results[route] = summarize([s['latency'] for s in ok], elapsed)
+        first_tokens = [s['first_token'] for s in ok if s['first_token'] is not None]
+        if first_tokens:
+            results[f"{route}_first_token"] = summarize(first_tokens)
+    if metrics.status_code == 200:
+        results['server_metrics'] = metrics.text
+    return results
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition(':')
+        if name not in ROUTES:
+            raise argparse.ArgumentTypeError(f"unknown route '{name}' (choose from {', '.join(ROUTES)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test against a fake Ollama server")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("ollama:1,book_rag:1,rag_llm:1"),
+                        help="route weights, e.g. ollama:2,book_rag:1")
+    parser.add_argument("--stream", action="store_true", help="use streaming /ask and measure time to first token")
+    parser.add_argument("--unique-questions", type=int, default=1000,
+                        help="distinct questions; fewer means more cache hits and coalescing")
+    parser.add_argument("--cache", action="store_true", help="keep the answer cache enabled")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--ollama-instances", type=int, default=1,
+                        help="fake Ollama servers to balance across, each on its own port")
+    parser.add_argument("--chapters", type=int, default=50)
+    parser.add_argument("--words", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app (repeatable)")
+    parser.add_argument("--app-url", default=None,
+                        help="test an already running app instead of starting one (with its own Ollama)")
+    parser.add_argument("--output", default=None, help="results JSON path (default: benchmarks/results/)")
+    for key, value in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--ollama-{key.replace('_', '-')}", dest=f"ollama_{key}", type=type(value), default=value,
+                            help=f"fake Ollama {key} (default: {value})")
+    args = parser.parse_args()
+
+    ollama_config = {key: getattr(args, f"ollama_{key}") for key in DEFAULT_CONFIG}
+    env_overrides = dict(item.split('=', 1) for item in args.env)
+    params = {key: value for key, value in vars(args).items() if key != 'output' and not key.startswith('ollama_')}
+    params['mix'] = args.mix
+    params['fake_ollama'] = ollama_config
+
+    processes = []
+    ollama_urls: List[str] = []
+    try:
+        app_url = args.app_url
+        if app_url is None:
+            workdir = tempfile.mkdtemp(prefix="askafrica-load-")
+            generate_corpus(os.path.join(workdir, "data", "chapters"), args.chapters, args.words)
+            for _ in range(args.ollama_instances):
+                ollama_port = free_port()
+                print(f"🤖 Starting fake Ollama on port {ollama_port}")
+                processes.append(start_fake_ollama(ollama_port, ollama_config))
+                ollama_urls.append(f"http://127.0.0.1:{ollama_port}")
+            app_port = free_port()
+            print(f"🚀 Starting app on port {app_port} ({args.workers} worker(s))")
+            processes.append(start_app(app_port, workdir, ollama_urls, args.workers, args.cache, env_overrides))
+            app_url = f"http://127.0.0.1:{app_port}"
+
+        routes = pick_routes(args.requests, args.mix, args.seed)
+        print(f"🔥 Sending {args.requests} requests with concurrency {args.concurrency}...")
+        results = asyncio.run(run_load(app_url, routes, args.concurrency, args.stream, args.unique_questions))
+        if ollama_urls:
+            results['fake_ollama'] = {url: httpx.get(f"{url}/_stats").json() for url in ollama_urls}
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    print(f"\n📊 Load test: {results['overall']['per_second']:.1f} req/s over {results['elapsed_s']:.1f}s, "
+          f"statuses {results['statuses']}")
+    for name, summary in results.items():
+        if isinstance(summary, dict) and 'p50_ms' in summary:
+            print_summary(name, summary)
+    save_results("load_test", params, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import random
+
+# Vocabulary the generated prose is drawn from; the programming terms make
+# the keyword bonuses and code-question paths fire as they do on the real book
+WORDS = (
+    "the a an of to in and is for with on that this it as by be are from or you your can will "
+    "program value values name names user users data file files number numbers text line lines "
+    "example examples output input result results error errors message messages item items "
+    "function functions variable variables loop loops condition conditions string strings "
+    "list lists dictionary dictionaries module modules class classes method methods object "
+    "objects python code test tests argument arguments return returns print call calls"
+).split()
+TOPICS = (
+    "Variables", "Lists", "Loops", "Functions", "Classes", "Files", "Exceptions", "Testing",
+    "Dictionaries", "Strings", "Modules", "Input", "Conditions", "Data", "Projects", "Games",
+)
+CODE_TEMPLATES = [
+    "def {name}({arg}):\n    \"\"\"{doc}\"\"\"\n    return {arg}\n\nprint({name}('{word}'))",
+    "class {title}:\n    def __init__(self, {arg}):\n        self.{arg} = {arg}\n\n    def {name}(self):\n        print(self.{arg})",
+    "for {arg} in {word}s:\n    if {arg}:\n        print({arg})",
+    "{arg} = {{'{word}': 1, '{name}': 2}}\nfor key, value in {arg}.items():\n    print(key, value)",
+]
+
+
+def make_paragraph(rng: random.Random, words: int) -> str:
+    sentences = []
+    remaining = words
+    while remaining > 0:
+        length = min(remaining, rng.randint(6, 18))
+        sentence = " ".join(rng.choice(WORDS) for _ in range(length))
+        sentences.append(sentence[0].upper() + sentence[1:] + ".")
+        remaining -= length
+    return " ".join(sentences)
+
+
+def make_code(rng: random.Random) -> str:
+    word = rng.choice(WORDS)
+    return rng.choice(CODE_TEMPLATES).format(
+        name=f"{rng.choice(['show', 'build', 'get', 'make'])}_{word}",
+        arg=rng.choice(["value", "item", "name", "number"]),
+        title=rng.choice(TOPICS).rstrip('s'),
+        doc=make_paragraph(rng, 6),
+        word=word,
+    )
+
+
+def make_chapter(rng: random.Random, number: int, words: int, code_ratio: float) -> str:
+    title = f"{rng.choice(TOPICS)} Part {number}"
+    blocks = []
+    written = 0
+    while written < words:
+        if rng.random() < code_ratio:
+            blocks.append(make_code(rng))
+        else:
+            length = rng.randint(40, 120)
+            blocks.append(make_paragraph(rng, length))
+            written += length
+    return f"Title: {title}\n" + "=" * 50 + "\n\n" + "\n\n".join(blocks) + "\n"
+
+
+def generate_corpus(output_dir: str, chapters: int = 50, words: int = 3000,
+                    code_ratio: float = 0.25, books: int = 1, seed: int = 42) -> int:
+    """
+    Write a deterministic synthetic corpus in the data/chapters layout.
+
+    With books > 1 the chapters are spread over book subdirectories the way
+    pdf_to_text's library ingestion lays them out. Returns the chapter count.
+    """
+    rng = random.Random(seed)
+    for number in range(1, chapters + 1):
+        book_dir = output_dir if books <= 1 else os.path.join(output_dir, f"book_{number % books + 1:02d}")
+        os.makedirs(book_dir, exist_ok=True)
+        path = os.path.join(book_dir, f"chapter_{number:03d}_synthetic.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(make_chapter(rng, number, words, code_ratio))
+    return chapters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic chapter corpus")
+    parser.add_argument("output", help="directory to write chapter files to (e.g. /tmp/bench/data/chapters)")
+    parser.add_argument("--chapters", type=int, default=50)
+    parser.add_argument("--words", type=int, default=3000, help="prose words per chapter")
+    parser.add_argument("--code-ratio", type=float, default=0.25, help="share of blocks that are code")
+    parser.add_argument("--books", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    count = generate_corpus(args.output, args.chapters, args.words, args.code_ratio, args.books, args.seed)
+    print(f"✅ Wrote {count} chapters to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,861 @@
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+from bisect import bisect_left, bisect_right
+from array import array
+from collections.abc import Mapping
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Tokens are lowercase runs of letters, digits and underscores so that
+# identifiers like `greet_user` survive as a single term.
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+
+# BM25 parameters (standard Okapi defaults)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Extra scoring features layered on top of BM25. These are expressed in BM25
+# units, so a title hit is worth roughly one strong body match.
+TITLE_BOOST = 3.0
+PHRASE_BONUS = 5.0
+CODE_BONUS = 1.0
+PROGRAMMING_TERM_BONUS = 1.5
+
+# Proximity: query terms whose closest occurrences sit within PROXIMITY_WINDOW
+# tokens of each other (per gap between terms) earn PROXIMITY_BONUS, fading
+# to nothing at PROXIMITY_SPREAD times that. Only the best
+# PROXIMITY_CANDIDATES chapters by the other scores are checked.
+PROXIMITY_BONUS = 3.0
+PROXIMITY_WINDOW = 8
+PROXIMITY_SPREAD = 4
+PROXIMITY_CANDIDATES = 20
+
+CODE_MARKERS = ['def ', 'class ', 'import ', 'print(', 'if ', 'for ', 'while ', 'return ']
+PROGRAMMING_TERMS = ['function', 'variable', 'loop', 'condition', 'string', 'list', 'dictionary', 'module']
+
+# Passage splitting: fenced code blocks are kept whole, everything else is
+# split on blank lines. A text block counts as code when one of its lines
+# looks like a Python statement.
+FENCE_PATTERN = re.compile(r'```.*?```', re.DOTALL)
+BLOCK_SEPARATOR = re.compile(r'\n[ \t]*\n')
+CODE_LINE_PATTERN = re.compile(
+    r'^\s*(?:def\s+\w+\s*\(|class\s+\w+|(?:for|while|if|elif)\s+.*:\s*$|import\s+\w+|from\s+\w+\s+import|print\()',
+    re.MULTILINE,
+)
+MIN_TEXT_PASSAGE_CHARS = 50
+CONTEXT_BLOCKS = 2  # text blocks kept in front of a code passage
+
+PASSAGE_TEXT = 0
+PASSAGE_CODE = 1
+
+# Preference for code passages when ranking snippets, higher for questions
+# that ask for code explicitly
+CODE_PASSAGE_BONUS = 0.5
+CODE_QUESTION_PASSAGE_BONUS = 2.0
+CODE_QUESTION_KEYWORDS = ['function', 'def', 'class', 'code', 'example', 'syntax', 'program', 'method', 'loop', 'variable']
+
+# Snapshot file layout:
+#   header (magic, version, metadata length)
+#   metadata JSON (sources, chapters, section layout)
+#   padding to 8 bytes, then the raw array sections back to back
+# Bump SNAPSHOT_VERSION whenever the layout or tokenization changes.
+SNAPSHOT_MAGIC = b'BKIX'
+SNAPSHOT_VERSION = 5
+SNAPSHOT_HEADER = struct.Struct('<4sIQ')
+
+# (attribute, array typecode) for every binary section of the snapshot
+ARRAY_SECTIONS = [
+    ('posting_docs', 'I'),
+    ('posting_tfs', 'I'),
+    ('posting_position_offsets', 'Q'),
+    ('posting_positions', 'I'),
+    ('title_docs', 'I'),
+    ('doc_lengths', 'I'),
+    ('doc_flags', 'B'),
+    ('doc_term_masks', 'I'),
+    ('text_offsets', 'Q'),
+    ('text_blob', 'B'),
+    ('doc_passage_offsets', 'I'),
+    ('passage_starts', 'Q'),
+    ('passage_ends', 'Q'),
+    ('passage_context_starts', 'Q'),
+    ('passage_kinds', 'B'),
+    ('passage_lengths', 'I'),
+    ('passage_token_starts', 'I'),
+    ('passage_posting_ids', 'I'),
+    ('passage_posting_tfs', 'I'),
+]
+
+# Term tables are stored as sorted sections too (see TermTable), so worker
+# processes mapping the same snapshot share them instead of each parsing a dict
+TERM_TABLES = ['terms', 'title_terms', 'passage_terms']
+TERM_TABLE_SECTIONS = [('blob', 'B'), ('offsets', 'Q'), ('spans', 'Q')]
+
+FLAG_HAS_CODE = 1
+
+
+def stem(token: str) -> str:
+    """Very light plural folding so `functions` matches `function`"""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase, plural-folded search terms"""
+    return [stem(token) for token in TOKEN_PATTERN.findall(text.lower())]
+
+
+def query_terms(query: str) -> List[str]:
+    """Unique query terms in order, ignoring very short words"""
+    seen = set()
+    terms = []
+    for term in tokenize(query):
+        if len(term) > 2 and term not in seen:
+            seen.add(term)
+            terms.append(term)
+    return terms
+
+
+def is_code_question(question: str) -> bool:
+    question_lower = question.lower()
+    return any(keyword in question_lower for keyword in CODE_QUESTION_KEYWORDS)
+
+
+def split_blocks(content: str) -> List[Tuple[int, int, bool]]:
+    """Split chapter text into (start, end, is_code) character spans"""
+    blocks = []
+    position = 0
+    for fence in FENCE_PATTERN.finditer(content):
+        blocks.extend(_split_text_blocks(content, position, fence.start()))
+        blocks.append((fence.start(), fence.end(), True))
+        position = fence.end()
+    blocks.extend(_split_text_blocks(content, position, len(content)))
+    return blocks
+
+
+def _split_text_blocks(content: str, start: int, end: int) -> List[Tuple[int, int, bool]]:
+    blocks = []
+    position = start
+    for separator in BLOCK_SEPARATOR.finditer(content, start, end):
+        blocks.append((position, separator.start()))
+        position = separator.end()
+    blocks.append((position, end))
+
+    spans = []
+    for block_start, block_end in blocks:
+        # Trim surrounding whitespace without copying the block
+        while block_start < block_end and content[block_start].isspace():
+            block_start += 1
+        while block_end > block_start and content[block_end - 1].isspace():
+            block_end -= 1
+        if block_start < block_end:
+            is_code = CODE_LINE_PATTERN.search(content, block_start, block_end) is not None
+            spans.append((block_start, block_end, is_code))
+    return spans
+
+
+def _align(offset: int, alignment: int = 8) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def _flatten(postings: Dict[str, List[array]], docs: array, extra: Optional[array] = None,
+             positions: Optional[array] = None) -> Dict[str, Tuple[int, int]]:
+    """Concatenate per-term arrays into flat arrays, returning term -> (offset, count)"""
+    table = {}
+    for term in sorted(postings):
+        entry = postings[term]
+        table[term] = (len(docs), len(entry[0]))
+        docs.extend(entry[0])
+        if extra is not None:
+            extra.extend(entry[1])
+        if positions is not None:
+            positions.extend(entry[2])
+    return table
+
+
+def _position_offsets(tfs) -> array:
+    """Start of each posting's run in the positions array (one extra end entry)"""
+    return array('Q', [0]) + array('Q', accumulate(tfs))
+
+
+def _remap_postings(table: Mapping, ids, tfs, id_map: Optional[array], base: int,
+                    postings: Dict[str, List[array]], positions=None, position_offsets=None):
+    """Append a term table's postings to `postings`, translating ids.
+
+    `id_map` maps old ids to new ones (-1 drops the posting); None means the
+    ids are kept in order and only shifted by `base`, which needs no per-posting
+    work when `base` is 0. Token positions, when given, are copied unchanged
+    since they count from the start of their own document.
+    """
+    for term, (offset, count) in table.items():
+        entry = postings.get(term)
+        if entry is None:
+            entry = postings[term] = [array('I'), array('I'), array('I')]
+        if id_map is None:
+            if base:
+                entry[0].extend([old_id + base for old_id in ids[offset:offset + count]])
+            else:
+                entry[0].extend(ids[offset:offset + count])
+            if tfs is not None:
+                entry[1].extend(tfs[offset:offset + count])
+            if positions is not None:
+                entry[2].extend(positions[position_offsets[offset]:position_offsets[offset + count]])
+            continue
+        for position in range(offset, offset + count):
+            new_id = id_map[ids[position]]
+            if new_id >= 0:
+                entry[0].append(new_id)
+                if tfs is not None:
+                    entry[1].append(tfs[position])
+                if positions is not None:
+                    entry[2].extend(positions[position_offsets[position]:position_offsets[position + 1]])
+
+
+def _windows(position_lists) -> Iterator[Tuple[int, int]]:
+    """(first, last) token of a window around each occurrence of the rarest term.
+
+    Each occurrence is paired with the nearest occurrence of every other
+    term, so the cost follows the shortest list, not the chapter length.
+    """
+    rarest = min(position_lists, key=len)
+    others = [list(positions) for positions in position_lists if positions is not rarest]
+    for anchor in rarest:
+        low = high = anchor
+        for positions in others:
+            at = bisect_left(positions, anchor)
+            if at == len(positions):
+                nearest = positions[-1]
+            elif at and anchor - positions[at - 1] < positions[at] - anchor:
+                nearest = positions[at - 1]
+            else:
+                nearest = positions[at]
+            if nearest < low:
+                low = nearest
+            elif nearest > high:
+                high = nearest
+        yield low, high
+
+
+def _min_width(position_lists) -> int:
+    """Tokens spanned by the tightest of the windows"""
+    best = None
+    for low, high in _windows(position_lists):
+        if best is None or high - low + 1 < best:
+            best = high - low + 1
+            if best == len(position_lists):
+                break  # the terms are adjacent: nothing tighter exists
+    return best
+
+
+def _proximity_limit(terms_found: int) -> int:
+    """Widest window (in tokens) that still earns a proximity bonus"""
+    return PROXIMITY_WINDOW * PROXIMITY_SPREAD * (terms_found - 1)
+
+
+def _proximity_bonus(width: int, terms_found: int, query_term_count: int) -> float:
+    """Bonus for terms_found query terms within a window of `width` tokens"""
+    if terms_found < 2 or query_term_count < 2:
+        return 0.0
+    gaps = terms_found - 1
+    near = PROXIMITY_WINDOW * gaps
+    limit = _proximity_limit(terms_found)
+    closeness = min(1.0, max(0.0, (limit - width) / (limit - near)))
+    return PROXIMITY_BONUS * closeness * gaps / (query_term_count - 1)
+
+
+class TermTable(Mapping):
+    """Read-only term -> (offset, count) table over flat arrays.
+
+    Terms are concatenated in sorted order into `blob`, delimited by
+    `offsets`; `spans` holds each term's (offset, count) pair. Lookups are a
+    binary search, so the table can live in a memory-mapped snapshot.
+    """
+
+    def __init__(self, blob, offsets, spans):
+        self.blob = blob
+        self.offsets = offsets
+        self.spans = spans
+
+    @classmethod
+    def pack(cls, table: Dict[str, Tuple[int, int]]) -> "TermTable":
+        blob = bytearray()
+        offsets = array('Q', [0])
+        spans = array('Q')
+        for term in sorted(table):
+            blob += term.encode('utf-8')
+            offsets.append(len(blob))
+            spans.extend(table[term])
+        return cls(bytes(blob), offsets, spans)
+
+    def _key(self, position: int) -> bytes:
+        return bytes(self.blob[self.offsets[position]:self.offsets[position + 1]])
+
+    def _span(self, position: int) -> Tuple[int, int]:
+        return self.spans[2 * position], self.spans[2 * position + 1]
+
+    def get(self, term: str, default=None):
+        key = term.encode('utf-8')
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self._key(low) == key:
+            return self._span(low)
+        return default
+
+    def __getitem__(self, term: str) -> Tuple[int, int]:
+        span = self.get(term)
+        if span is None:
+            raise KeyError(term)
+        return span
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self) -> Iterator[str]:
+        for position in range(len(self)):
+            yield str(self._key(position), 'utf-8')
+
+    def items(self) -> Iterator[Tuple[str, Tuple[int, int]]]:
+        for position in range(len(self)):
+            yield str(self._key(position), 'utf-8'), self._span(position)
+
+
+class BookIndex:
+    """Inverted index over chapters with BM25 ranking.
+
+    All postings live in flat arrays (doc ids and term frequencies) addressed
+    through a term -> (offset, count) table, so a query only touches the
+    posting lists of its own terms. The same layout is written verbatim to
+    the on-disk snapshot and memory-mapped back, so a loaded index never
+    copies postings, term tables or chapter text onto the heap, and every
+    process mapping the snapshot shares one copy through the page cache.
+    """
+
+    def __init__(self):
+        self.chapters: List[Dict] = []
+        # term -> (offset, count): dicts when built, TermTables when loaded
+        self.terms: Mapping = {}
+        self.title_terms: Mapping = {}
+        self.posting_docs = array('I')
+        self.posting_tfs = array('I')
+        # Token positions of every posting, ascending, in posting order; the
+        # positions of posting p are posting_positions[offsets[p]:offsets[p + 1]]
+        self.posting_position_offsets = array('Q', [0])
+        self.posting_positions = array('I')
+        self.title_docs = array('I')
+        self.doc_lengths = array('I')
+        self.doc_flags = array('B')
+        self.doc_term_masks = array('I')
+        self.text_offsets = array('Q', [0])
+        self.text_blob = b''
+        self.avg_doc_length = 0.0
+        # Passages: contiguous per document, byte spans into text_blob
+        self.passage_terms: Mapping = {}
+        self.doc_passage_offsets = array('I', [0])
+        self.passage_starts = array('Q')
+        self.passage_ends = array('Q')
+        self.passage_context_starts = array('Q')
+        self.passage_kinds = array('B')
+        self.passage_lengths = array('I')
+        self.passage_token_starts = array('I')  # position of a passage's first token in its chapter
+        self.passage_posting_ids = array('I')
+        self.passage_posting_tfs = array('I')
+        self.avg_passage_length = 0.0
+
+    @property
+    def doc_count(self) -> int:
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, chapters: List[Dict]) -> "BookIndex":
+        """Build the index from loaded chapter dicts (`filename`, `book_id`, `title`, `content`)"""
+        index = cls()
+        postings: Dict[str, List[array]] = {}
+        title_postings: Dict[str, List[array]] = {}
+        passage_postings: Dict[str, List[array]] = {}
+        encoded = []
+
+        for doc_id, chapter in enumerate(chapters):
+            content = chapter['content']
+            content_lower = content.lower()
+            tokens = index._add_passages(content, index.text_offsets[-1], passage_postings)
+
+            occurrences: Dict[str, List[int]] = {}
+            for position, token in enumerate(tokens):
+                positions = occurrences.get(token)
+                if positions is None:
+                    occurrences[token] = [position]
+                else:
+                    positions.append(position)
+            for term, positions in occurrences.items():
+                entry = postings.get(term)
+                if entry is None:
+                    entry = postings[term] = [array('I'), array('I'), array('I')]
+                entry[0].append(doc_id)
+                entry[1].append(len(positions))
+                entry[2].extend(positions)
+
+            for term in set(tokenize(chapter['title'])):
+                title_postings.setdefault(term, [array('I')])[0].append(doc_id)
+
+            mask = 0
+            for bit, term in enumerate(PROGRAMMING_TERMS):
+                if term in content_lower:
+                    mask |= 1 << bit
+            has_code = any(marker in content_lower for marker in CODE_MARKERS)
+
+            index.chapters.append({
+                'filename': chapter['filename'],
+                'book_id': chapter['book_id'],
+                'title': chapter['title'],
+            })
+            index.doc_lengths.append(len(tokens))
+            index.doc_flags.append(FLAG_HAS_CODE if has_code else 0)
+            index.doc_term_masks.append(mask)
+            data = content.encode('utf-8')
+            encoded.append(data)
+            index.text_offsets.append(index.text_offsets[-1] + len(data))
+
+        index.terms = _flatten(postings, index.posting_docs, index.posting_tfs, index.posting_positions)
+        index.posting_position_offsets = _position_offsets(index.posting_tfs)
+        index.title_terms = _flatten(title_postings, index.title_docs)
+        index.passage_terms = _flatten(passage_postings, index.passage_posting_ids, index.passage_posting_tfs)
+        index.text_blob = b''.join(encoded)
+        if index.doc_count:
+            index.avg_doc_length = sum(index.doc_lengths) / index.doc_count
+        if index.passage_lengths:
+            index.avg_passage_length = sum(index.passage_lengths) / len(index.passage_lengths)
+        return index
+
+    def _add_passages(self, content: str, base: int, passage_postings: Dict[str, List[array]]) -> List[str]:
+        """Split one chapter into passages, record them as byte spans and return the chapter's tokens.
+
+        Blocks only ever split on whitespace, so tokenizing block by block
+        gives the same token stream as the whole chapter, with each
+        passage's tokens at a known position in it.
+        """
+        byte_offset = base
+        char_offset = 0
+        context_blocks: List[int] = []
+        doc_tokens: List[str] = []
+
+        for start, end, is_code in split_blocks(content):
+            # Convert character offsets to absolute byte offsets incrementally
+            byte_offset += len(content[char_offset:start].encode('utf-8'))
+            byte_start = byte_offset
+            byte_offset += len(content[start:end].encode('utf-8'))
+            char_offset = end
+
+            text = content[start:end]
+            tokens = tokenize(text)
+            token_start = len(doc_tokens)
+            doc_tokens.extend(tokens)
+            if text.startswith('Title:') or text.startswith('==='):
+                context_blocks = []
+                continue
+
+            if is_code:
+                context_start = context_blocks[0] if context_blocks else byte_start
+                kind = PASSAGE_CODE
+            elif len(text) >= MIN_TEXT_PASSAGE_CHARS:
+                context_start = byte_start
+                kind = PASSAGE_TEXT
+            else:
+                context_start = None
+                kind = None
+
+            if kind is not None:
+                passage_id = len(self.passage_starts)
+                frequencies: Dict[str, int] = {}
+                for token in tokens:
+                    frequencies[token] = frequencies.get(token, 0) + 1
+                for term, tf in frequencies.items():
+                    entry = passage_postings.get(term)
+                    if entry is None:
+                        entry = passage_postings[term] = [array('I'), array('I')]
+                    entry[0].append(passage_id)
+                    entry[1].append(tf)
+                self.passage_starts.append(byte_start)
+                self.passage_ends.append(byte_offset)
+                self.passage_context_starts.append(context_start)
+                self.passage_kinds.append(kind)
+                self.passage_lengths.append(len(tokens))
+                self.passage_token_starts.append(token_start)
+
+            if is_code:
+                context_blocks = []
+            else:
+                context_blocks = (context_blocks + [byte_start])[-CONTEXT_BLOCKS:]
+
+        self.doc_passage_offsets.append(len(self.passage_starts))
+        return doc_tokens
+
+    @classmethod
+    def merge(cls, parts: List[Tuple["BookIndex", Iterable[int]]]) -> "BookIndex":
+        """Combine documents of existing indexes into a new one without re-analyzing them.
+
+        `parts` is a list of (index, ascending doc ids to keep). Documents are
+        renumbered in that order; their postings, passages and text bytes are
+        copied with doc ids, passage ids and byte offsets shifted accordingly.
+        """
+        index = cls()
+        remapped = []
+        blobs = []
+
+        for part, doc_ids in parts:
+            doc_ids = list(doc_ids)
+            doc_base = index.doc_count
+            passage_base = len(index.passage_lengths)
+            # Keeping every document needs no id map, just a constant shift
+            contiguous = doc_ids == list(range(part.doc_count))
+            doc_map = None if contiguous else array('i', [-1]) * part.doc_count
+            passage_map = None if contiguous else array('i', [-1]) * len(part.passage_lengths)
+
+            for doc_id in doc_ids:
+                new_id = index.doc_count
+                if doc_map is not None:
+                    doc_map[doc_id] = new_id
+                index.chapters.append(part.chapters[doc_id])
+                index.doc_lengths.append(part.doc_lengths[doc_id])
+                index.doc_flags.append(part.doc_flags[doc_id])
+                index.doc_term_masks.append(part.doc_term_masks[doc_id])
+
+                start = part.text_offsets[doc_id]
+                end = part.text_offsets[doc_id + 1]
+                blobs.append(part.text_blob[start:end])
+                new_start = index.text_offsets[-1]
+                index.text_offsets.append(new_start + end - start)
+
+                for passage_id in range(part.doc_passage_offsets[doc_id], part.doc_passage_offsets[doc_id + 1]):
+                    if passage_map is not None:
+                        passage_map[passage_id] = len(index.passage_lengths)
+                    index.passage_starts.append(part.passage_starts[passage_id] - start + new_start)
+                    index.passage_ends.append(part.passage_ends[passage_id] - start + new_start)
+                    index.passage_context_starts.append(part.passage_context_starts[passage_id] - start + new_start)
+                    index.passage_kinds.append(part.passage_kinds[passage_id])
+                    index.passage_lengths.append(part.passage_lengths[passage_id])
+                    index.passage_token_starts.append(part.passage_token_starts[passage_id])
+                index.doc_passage_offsets.append(len(index.passage_lengths))
+
+            remapped.append((part, doc_map, doc_base, passage_map, passage_base))
+
+        postings: Dict[str, List[array]] = {}
+        title_postings: Dict[str, List[array]] = {}
+        passage_postings: Dict[str, List[array]] = {}
+        for part, doc_map, doc_base, passage_map, passage_base in remapped:
+            _remap_postings(part.terms, part.posting_docs, part.posting_tfs, doc_map, doc_base, postings,
+                            part.posting_positions, part.posting_position_offsets)
+            _remap_postings(part.title_terms, part.title_docs, None, doc_map, doc_base, title_postings)
+            _remap_postings(part.passage_terms, part.passage_posting_ids, part.passage_posting_tfs,
+                            passage_map, passage_base, passage_postings)
+
+        index.terms = _flatten({t: e for t, e in postings.items() if e[0]}, index.posting_docs, index.posting_tfs,
+                               index.posting_positions)
+        index.posting_position_offsets = _position_offsets(index.posting_tfs)
+        index.title_terms = _flatten({t: e for t, e in title_postings.items() if e[0]}, index.title_docs)
+        index.passage_terms = _flatten({t: e for t, e in passage_postings.items() if e[0]},
+                                       index.passage_posting_ids, index.passage_posting_tfs)
+        index.text_blob = b''.join(blobs)
+        if index.doc_count:
+            index.avg_doc_length = sum(index.doc_lengths) / index.doc_count
+        if index.passage_lengths:
+            index.avg_passage_length = sum(index.passage_lengths) / len(index.passage_lengths)
+        return index
+
+    def updated(self, removed: Set[str], chapters: List[Dict]) -> "BookIndex":
+        """Return a new index without the `removed` chapter files and with `chapters` added.
+
+        Only the new chapters are tokenized; everything else is copied from
+        this index, which is left untouched for queries still running on it.
+        """
+        kept = [doc_id for doc_id, chapter in enumerate(self.chapters) if chapter['filename'] not in removed]
+        return BookIndex.merge([(self, kept), (BookIndex.build(chapters), range(len(chapters)))])
+
+    def content(self, doc_id: int) -> str:
+        """Decode the full text of one chapter"""
+        start = self.text_offsets[doc_id]
+        end = self.text_offsets[doc_id + 1]
+        return str(self.text_blob[start:end], 'utf-8')
+
+    def passage_text(self, passage_id: int, with_context: bool = False) -> str:
+        start = self.passage_context_starts[passage_id] if with_context else self.passage_starts[passage_id]
+        return str(self.text_blob[start:self.passage_ends[passage_id]], 'utf-8')
+
+    def term_positions(self, term: str, doc_id: int, span: Optional[Tuple[int, int]] = None):
+        """Ascending token positions of a term in one chapter (empty if it does not occur)"""
+        span = span or self.terms.get(term)
+        if span is None:
+            return ()
+        offset, count = span
+        posting = bisect_left(self.posting_docs, doc_id, offset, offset + count)
+        if posting == offset + count or self.posting_docs[posting] != doc_id:
+            return ()
+        return self.posting_positions[self.posting_position_offsets[posting]:self.posting_position_offsets[posting + 1]]
+
+    def phrase_starts(self, doc_id: int, phrase: List[str], spans: Optional[Dict] = None) -> List[int]:
+        """Positions in a chapter where the phrase's terms occur back to back, ascending.
+
+        Intersects the terms' position lists (shifted by their place in the
+        phrase), so the cost follows the posting sizes, not the chapter length.
+        `spans` may carry term table lookups already done for the query.
+        """
+        spans = spans or {}
+        position_lists = [self.term_positions(term, doc_id, spans.get(term)) for term in phrase]
+        if not all(position_lists):
+            return []
+        # Candidate starts from the rarest term, narrowed by each of the others
+        order = sorted(range(len(phrase)), key=lambda which: len(position_lists[which]))
+        starts = {position - order[0] for position in position_lists[order[0]]}
+        for which in order[1:]:
+            starts.intersection_update([position - which for position in position_lists[which]])
+            if not starts:
+                return []
+        return sorted(starts)
+
+    def best_passages(self, doc_id: int, query: str, limit: int = 1) -> List[int]:
+        """Rank one chapter's passages against the query, best first.
+
+        Only the passage postings of the query terms are touched; each list is
+        sorted by passage id so the chapter's range is found by bisection.
+        Passages holding the exact phrase, or the query terms close together,
+        are found from the chapter's token positions and ranked up.
+        """
+        first = self.doc_passage_offsets[doc_id]
+        last = self.doc_passage_offsets[doc_id + 1]
+        if first == last:
+            return []
+
+        total_passages = len(self.passage_lengths)
+        avg_length = self.avg_passage_length or 1.0
+        scores: Dict[int, float] = {}
+        terms = query_terms(query)
+        for term in terms:
+            span = self.passage_terms.get(term)
+            if span is None:
+                continue
+            offset, count = span
+            ids = self.passage_posting_ids
+            lo = bisect_left(ids, first, offset, offset + count)
+            hi = bisect_left(ids, last, lo, offset + count)
+            if lo == hi:
+                continue
+            idf = math.log(1 + (total_passages - count + 0.5) / (count + 0.5))
+            for position in range(lo, hi):
+                passage_id = ids[position]
+                tf = self.passage_posting_tfs[position]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.passage_lengths[passage_id] / avg_length)
+                scores[passage_id] = scores.get(passage_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        if len(terms) > 1:
+            self._add_passage_proximity(doc_id, first, last, query, terms, scores)
+
+        code_bonus = CODE_QUESTION_PASSAGE_BONUS if is_code_question(query) else CODE_PASSAGE_BONUS
+        for passage_id in scores:
+            if self.passage_kinds[passage_id] == PASSAGE_CODE:
+                scores[passage_id] += code_bonus
+
+        ranked = [passage_id for passage_id, _ in
+                  heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))]
+        if not ranked:
+            # Nothing matched: fall back to the first code passage, then the first passage
+            code_passages = [p for p in range(first, last) if self.passage_kinds[p] == PASSAGE_CODE]
+            ranked = (code_passages or [first])[:limit]
+        return ranked
+
+    def _passage_at(self, token_position: int, first: int, last: int) -> Optional[int]:
+        """The passage of passages [first, last) covering a token position, if any"""
+        passage_id = bisect_right(self.passage_token_starts, token_position, first, last) - 1
+        if passage_id < first or token_position >= self.passage_token_starts[passage_id] + self.passage_lengths[passage_id]:
+            return None
+        return passage_id
+
+    def _add_passage_proximity(self, doc_id: int, first: int, last: int, query: str, terms: List[str],
+                               scores: Dict[int, float]):
+        for start in self.phrase_starts(doc_id, tokenize(query)):
+            passage_id = self._passage_at(start, first, last)
+            if passage_id is not None:
+                scores[passage_id] = scores.get(passage_id, 0.0) + PHRASE_BONUS
+
+        # One pass over the chapter's windows; each passage keeps its tightest one
+        position_lists = [positions for positions in (self.term_positions(term, doc_id) for term in terms) if positions]
+        if len(position_lists) < 2:
+            return
+        widths: Dict[int, int] = {}
+        limit = _proximity_limit(len(position_lists))
+        for low, high in _windows(position_lists):
+            if high - low >= limit:
+                continue
+            passage_id = self._passage_at(low, first, last)
+            if passage_id is not None and self._passage_at(high, first, last) == passage_id:
+                width = high - low + 1
+                if width < widths.get(passage_id, width + 1):
+                    widths[passage_id] = width
+        for passage_id, width in widths.items():
+            scores[passage_id] = scores.get(passage_id, 0.0) + _proximity_bonus(width, len(position_lists), len(terms))
+
+    def idf(self, term: str) -> float:
+        span = self.terms.get(term)
+        df = span[1] if span else 0
+        return math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+    def score(self, query: str) -> Dict[int, float]:
+        """Score every document that shares at least one term with the query"""
+        terms = query_terms(query)
+        scores: Dict[int, float] = {}
+        if not terms or not self.doc_count:
+            return scores
+
+        avg_length = self.avg_doc_length or 1.0
+        matched_terms: Dict[int, int] = {}
+        spans = {}
+        for term in terms:
+            span = spans[term] = self.terms.get(term)
+            if span is None:
+                continue
+            offset, count = span
+            idf = self.idf(term)
+            doc_ids = self.posting_docs[offset:offset + count]
+            tfs = self.posting_tfs[offset:offset + count]
+            for doc_id, tf in zip(doc_ids, tfs):
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+                matched_terms[doc_id] = matched_terms.get(doc_id, 0) + 1
+
+        # Title matches
+        for term in terms:
+            span = self.title_terms.get(term)
+            if span is None:
+                continue
+            offset, count = span
+            for doc_id in self.title_docs[offset:offset + count]:
+                scores[doc_id] = scores.get(doc_id, 0.0) + TITLE_BOOST
+
+        query_lower = query.lower()
+        asked_mask = 0
+        for bit, term in enumerate(PROGRAMMING_TERMS):
+            if term in query_lower:
+                asked_mask |= 1 << bit
+        phrase = tokenize(query)
+        for term in phrase:
+            if term not in spans:
+                spans[term] = self.terms.get(term)
+
+        for doc_id in scores:
+            if self.doc_flags[doc_id] & FLAG_HAS_CODE:
+                scores[doc_id] += CODE_BONUS
+            if asked_mask:
+                shared = bin(asked_mask & self.doc_term_masks[doc_id]).count('1')
+                scores[doc_id] += PROGRAMMING_TERM_BONUS * shared
+            # An exact phrase can only occur where every query term occurs
+            if len(phrase) > 1 and matched_terms.get(doc_id, 0) == len(terms):
+                if self.phrase_starts(doc_id, phrase, spans):
+                    scores[doc_id] += PHRASE_BONUS
+
+        if len(terms) > 1:
+            candidates = heapq.nlargest(PROXIMITY_CANDIDATES, (doc_id for doc_id in scores
+                                                               if matched_terms.get(doc_id, 0) > 1),
+                                        key=scores.__getitem__)
+            for doc_id in candidates:
+                position_lists = [positions for positions in
+                                  (self.term_positions(term, doc_id, spans[term]) for term in terms) if positions]
+                if len(position_lists) > 1:
+                    width = _min_width(position_lists)
+                    scores[doc_id] += _proximity_bonus(width, len(position_lists), len(terms))
+
+        return scores
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[int, float]]:
+        """Return the top_k (doc_id, score) pairs, best first"""
+        scores = self.score(query)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def save(self, path: str, sources: List[List]):
+        """Write the index to a versioned binary snapshot keyed on `sources`"""
+        arrays = [(name, getattr(self, name)) for name, _ in ARRAY_SECTIONS]
+        for table_name in TERM_TABLES:
+            table = getattr(self, table_name)
+            if not isinstance(table, TermTable):
+                table = TermTable.pack(table)
+            arrays += [(f"{table_name}_{part}", getattr(table, part)) for part, _ in TERM_TABLE_SECTIONS]
+
+        sections = {}
+        blobs = []
+        offset = 0
+        for name, data in arrays:
+            data = data.tobytes() if hasattr(data, 'tobytes') else bytes(data)
+            sections[name] = [offset, len(data)]
+            blobs.append((offset, data))
+            offset = _align(offset + len(data))
+
+        meta = json.dumps({
+            'version': SNAPSHOT_VERSION,
+            'byteorder': sys.byteorder,
+            'sources': sources,
+            'chapters': self.chapters,
+            'avg_doc_length': self.avg_doc_length,
+            'avg_passage_length': self.avg_passage_length,
+            'sections': sections,
+        }).encode('utf-8')
+        base = _align(SNAPSHOT_HEADER.size + len(meta))
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(meta)))
+            f.write(meta)
+            for section_offset, data in blobs:
+                f.seek(base + section_offset)
+                f.write(data)
+        # Atomic replace so concurrently starting workers never see a partial file
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, sources: List[List]) -> Optional["BookIndex"]:
+        """Memory-map a snapshot, or return None if it is missing or stale"""
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        if len(mapped) < SNAPSHOT_HEADER.size:
+            return None
+        magic, version, meta_length = SNAPSHOT_HEADER.unpack_from(mapped, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            return None
+
+        meta = json.loads(mapped[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + meta_length])
+        if meta['sources'] != sources or meta['byteorder'] != sys.byteorder:
+            return None
+
+        index = cls()
+        index.chapters = meta['chapters']
+        index.avg_doc_length = meta['avg_doc_length']
+        index.avg_passage_length = meta['avg_passage_length']
+
+        base = _align(SNAPSHOT_HEADER.size + meta_length)
+        view = memoryview(mapped)
+
+        def section(name: str, typecode: str):
+            offset, length = meta['sections'][name]
+            return view[base + offset:base + offset + length].cast(typecode)
+
+        for name, typecode in ARRAY_SECTIONS:
+            setattr(index, name, section(name, typecode))
+        for table_name in TERM_TABLES:
+            setattr(index, table_name, TermTable(*(section(f"{table_name}_{part}", typecode)
+                                                   for part, typecode in TERM_TABLE_SECTIONS)))
+        return index
@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Named latency tiers for /ask. Each sets Ollama generation options; a
+# request picks one with `latency`, otherwise its route's default applies.
+LATENCY_DEFAULT = os.getenv("LATENCY_DEFAULT", "balanced")
+# Per-route defaults, e.g. "ollama=fast,rag_llm=balanced"
+LATENCY_ROUTE_DEFAULTS = os.getenv("LATENCY_ROUTE_DEFAULTS", "")
+# JSON overrides merged over the built-in presets, e.g. '{"fast": {"num_predict": 96}}'
+LATENCY_PRESETS = os.getenv("LATENCY_PRESETS", "")
+
+# Server-side limits applied to every preset (0 = no limit). A num_predict
+# limit also caps presets that leave it unset or unlimited (-1).
+LATENCY_MAX_NUM_PREDICT = int(os.getenv("LATENCY_MAX_NUM_PREDICT", "0"))
+LATENCY_MAX_NUM_CTX = int(os.getenv("LATENCY_MAX_NUM_CTX", "8192"))
+LATENCY_MAX_NUM_THREAD = int(os.getenv("LATENCY_MAX_NUM_THREAD", "0"))
+
+# The tiers differ in answer length only, and the default one sends no
+# options, so requests that do not pick a tier behave as before presets
+# existed. Ollama reloads the model whenever num_ctx or num_thread change
+# between requests, so presets that are mixed in live traffic should agree
+# on those two.
+BUILTIN_PRESETS = {
+    "fast": {"num_predict": 128},
+    "balanced": {},  # the model's defaults
+    "thorough": {"num_predict": -1},  # never cut the answer short
+}
+
+OPTION_NAMES = ("num_predict", "num_ctx", "num_thread")
+
+
+class LatencyPreset:
+    """Ollama options for one tier; unset values keep the model's defaults"""
+
+    def __init__(self, name: str, num_predict: Optional[int] = None, num_ctx: Optional[int] = None,
+                 num_thread: Optional[int] = None, keep_alive: Optional[str] = None):
+        self.name = name
+        self.num_predict = num_predict
+        self.num_ctx = num_ctx
+        self.num_thread = num_thread
+        self.keep_alive = keep_alive
+
+    def options(self) -> Dict:
+        """The `options` object for /api/generate"""
+        return {name: getattr(self, name) for name in OPTION_NAMES if getattr(self, name) is not None}
+
+    def limited(self, limits: Dict[str, int]) -> "LatencyPreset":
+        values = self.options()
+        for name, limit in limits.items():
+            if limit <= 0:
+                continue
+            if name == "num_predict" and values.get(name, -1) < 0:
+                values[name] = limit
+            elif name in values and values[name] > limit:
+                logger.warning(f"Latency preset {self.name}: {name} {values[name]} capped at {limit}")
+                values[name] = limit
+        return LatencyPreset(self.name, keep_alive=self.keep_alive, **values)
+
+    def as_dict(self) -> Dict:
+        return {**self.options(), "keep_alive": self.keep_alive}
+
+
+class LatencyPresets:
+    """The configured tiers, their server-side limits and the default tier per route"""
+
+    def __init__(self, presets: Optional[Dict[str, Dict]] = None, default: str = LATENCY_DEFAULT,
+                 route_defaults: str = LATENCY_ROUTE_DEFAULTS, limits: Optional[Dict[str, int]] = None):
+        if presets is None:
+            presets = {name: dict(values) for name, values in BUILTIN_PRESETS.items()}
+            for name, values in (json.loads(LATENCY_PRESETS) if LATENCY_PRESETS else {}).items():
+                presets[name] = {**presets.get(name, {}), **values}
+        if limits is None:
+            limits = {
+                "num_predict": LATENCY_MAX_NUM_PREDICT,
+                "num_ctx": LATENCY_MAX_NUM_CTX,
+                "num_thread": LATENCY_MAX_NUM_THREAD,
+            }
+        self.limits = limits
+        self.presets = {name: LatencyPreset(name, **values).limited(limits) for name, values in presets.items()}
+        self.default = default
+        self.route_defaults: Dict[str, str] = {}
+        for entry in route_defaults.split(","):
+            if "=" in entry:
+                route, name = entry.split("=", 1)
+                self.route_defaults[route.strip()] = name.strip()
+        for name in [default, *self.route_defaults.values()]:
+            if name not in self.presets:
+                raise ValueError(f"Unknown default latency preset: {name}")
+
+    def resolve(self, name: Optional[str], route: str) -> LatencyPreset:
+        """The preset a request asked for, or its route's default; KeyError if unknown"""
+        if name is None:
+            name = self.route_defaults.get(route, self.default)
+        return self.presets[name]
+
+    def stats(self) -> Dict:
+        return {
+            "default": self.default,
+            "route_defaults": self.route_defaults,
+            "presets": {name: preset.as_dict() for name, preset in self.presets.items()},
+            "limits": self.limits,
+        }
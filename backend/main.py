@@ -1,11 +1,27 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-import httpx
+from typing import AsyncIterator, List, Optional
+import asyncio
+import hmac
+import json
 import os
 import logging
+import time
 from dotenv import load_dotenv
-from simple_rag import initialize_simple_rag, query_simple_rag
+from simple_rag import (
+    initialize_simple_rag, reload_simple_rag, aanswer_simple_rag, aretrieve_context_simple_rag,
+    aanswer_many_simple_rag, aretrieve_context_many_simple_rag, simple_rag_system, RAG_WATCH_INTERVAL
+)
+from answer_cache import AnswerCache, make_cache_key
+from sessions import Session, SessionStore
+from profiling import Profiler, ProfilingMiddleware
+from latency_presets import LatencyPreset, LatencyPresets
+from query_log import QueryLog
+from ollama_client import OllamaClient, OllamaError
+from admission import AdmissionController, AdmissionError, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from metrics import registry, REQUESTS, REQUEST_SECONDS, IN_FLIGHT, CACHE_ENTRIES
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -29,26 +45,143 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in stack sampling of /ask requests (PROFILE_ENABLED or POST /admin/profiling)
+profiler = Profiler()
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
 # Pydantic models
 class QuestionRequest(BaseModel):
     question: str
     use_rag: bool = False  # New parameter to enable RAG
+    augment: bool = False  # With use_rag: feed book passages to the LLM instead of returning them
+    stream: bool = False  # Stream the answer as NDJSON events
+    session_id: Optional[str] = None  # Continue a conversation (Ollama answers only)
+    latency: Optional[str] = None  # "fast", "balanced" or "thorough" (default per route)
 
 class QuestionResponse(BaseModel):
     answer: str
     model: str
-    source: str = "ollama"  # "ollama" or "book_rag"
+    source: str = "ollama"  # "ollama", "book_rag" or "rag_llm"
+    sources: List[str] = []  # book chapters the answer was grounded on
+    book_ids: List[str] = []  # books those chapters belong to
+    cached: bool = False
+    session_id: Optional[str] = None
+    latency: Optional[str] = None  # preset the answer was generated with
+
+class BatchRequest(BaseModel):
+    questions: List[QuestionRequest]  # per-question `stream` and `session_id` are ignored
+    stream: bool = False  # Send each result as an NDJSON line as soon as it is ready
+
+class BatchItem(BaseModel):
+    index: int  # position in BatchRequest.questions
+    response: Optional[QuestionResponse] = None
+    error: Optional[str] = None
+    status_code: int = 200
+    retry_after: Optional[int] = None  # seconds, when the item was shed under load
+
+class BatchResponse(BaseModel):
+    results: List[BatchItem]
+
+class ProfilingSettings(BaseModel):
+    enabled: Optional[bool] = None
+    slow_ms: Optional[float] = None  # keep profiles of requests slower than this, 0 = only on request
 
 # Ollama configuration
-OLLAMA_URL = "http://localhost:11434"
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+# Comma-separated Ollama servers to balance generations across (default: OLLAMA_URL)
+OLLAMA_URLS = [url.strip() for url in os.getenv("OLLAMA_URLS", OLLAMA_URL).split(",") if url.strip()]
 MODEL_NAME = os.getenv("OLLAMA_MODEL", "saidgpt")
+# How long Ollama keeps the model loaded after a request
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Load the model on every Ollama server at startup, waiting at most this long
+OLLAMA_WARMUP = os.getenv("OLLAMA_WARMUP", "1").lower() in ("1", "true", "yes")
+OLLAMA_WARMUP_TIMEOUT = float(os.getenv("OLLAMA_WARMUP_TIMEOUT", "120"))
+
+# Token required in the X-Admin-Token header by /admin endpoints. Without one
+# they only answer clients on this machine.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+# /ask/batch limits: questions per call, and Ollama generations in flight
+# across all batches (single /ask calls are not counted)
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+# On startup, answer the most frequent questions of the last CACHE_PREWARM_WINDOW
+# seconds from the query log (0 = off). Only book-only answers, which need no
+# Ollama generation, unless CACHE_PREWARM_GENERATE is set; generations are
+# then replayed by a single worker
+CACHE_PREWARM_COUNT = int(os.getenv("CACHE_PREWARM_COUNT", "50"))
+CACHE_PREWARM_WINDOW = float(os.getenv("CACHE_PREWARM_WINDOW", "86400"))
+CACHE_PREWARM_GENERATE = os.getenv("CACHE_PREWARM_GENERATE", "0").lower() in ("1", "true", "yes")
+
+# Instructions for retrieval-augmented answers. They always open the prompt
+# unchanged, so Ollama can reuse the already evaluated prefix from its
+# prompt cache while the model stays loaded (keep_alive).
+RAG_INSTRUCTIONS = (
+    "Answer the question using the book excerpts below, each headed by its book and chapter. "
+    "Prefer the books' own code examples and keep them intact. "
+    "If the excerpts do not cover the question, say so briefly and answer from general knowledge.\n\n"
+)
+
+# Application-lifetime Ollama client (pooled, coalescing), created on startup
+ollama = None
+batch_slots = None  # asyncio.Semaphore(BATCH_CONCURRENCY), created on startup
+
+# Responses keyed on normalized question, use_rag and model
+answer_cache = AnswerCache()
+
+# Multi-turn conversations: Ollama context from the previous turn, by session_id
+sessions = SessionStore()
+
+# Latency tiers mapped to Ollama options (num_predict, num_ctx, num_thread, keep_alive)
+latency_presets = LatencyPresets()
+
+# Normalized questions with route, latency and cache outcome, written in batches
+query_log = QueryLog()
+
+# Background task polling data/chapters for changes (RAG_WATCH_INTERVAL)
+chapter_watcher = None
+# Background task answering frequent questions into the cache after startup
+cache_prewarmer = None
+# Background task loading the model on every Ollama server (OLLAMA_WARMUP)
+model_warmup = None
+
+async def reload_corpus() -> dict:
+    """Reload changed chapter files without blocking the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(None, reload_simple_rag)
+
+async def watch_chapters(interval: float):
+    """Pick up added, changed and removed chapter files every `interval` seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reload_corpus()
+        except Exception as e:
+            logger.error(f"❌ Error reloading chapters: {e}")
 
 # Initialize RAG system on startup
 @app.on_event("startup")
 async def startup_event():
     """Initialize RAG system on startup"""
+    global ollama, batch_slots, chapter_watcher, cache_prewarmer, model_warmup
     logger.info("🚀 Initializing AskAfrica API...")
     
+    ollama = OllamaClient(OLLAMA_URLS, AdmissionController())
+    ollama.start()
+    if len(OLLAMA_URLS) > 1:
+        logger.info(f"🔀 Balancing generations across {len(OLLAMA_URLS)} Ollama servers")
+    batch_slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+    query_log.start()
+    
+    # Load the model now, with the options requests will use, so the first
+    # question does not pay for it; in the background, so /health and book
+    # answers are served while it loads
+    if OLLAMA_WARMUP:
+        model_warmup = asyncio.create_task(ollama.warm_up(
+            ollama_payload_for("", latency_presets.resolve(None, "ollama")), OLLAMA_WARMUP_TIMEOUT
+        ))
+    
     # Try to initialize RAG system
     try:
         rag_success = initialize_simple_rag()
@@ -58,6 +191,121 @@ async def startup_event():
             logger.warning("⚠️  RAG system not available - will use Ollama only")
     except Exception as e:
         logger.error(f"❌ Error initializing RAG system: {e}")
+    
+    if RAG_WATCH_INTERVAL > 0:
+        logger.info(f"👀 Watching chapter files every {RAG_WATCH_INTERVAL:g}s")
+        chapter_watcher = asyncio.create_task(watch_chapters(RAG_WATCH_INTERVAL))
+    
+    if CACHE_PREWARM_COUNT > 0 and answer_cache.enabled and query_log.enabled:
+        cache_prewarmer = asyncio.create_task(prewarm_answer_cache())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled connections to Ollama and stop RAG workers"""
+    if chapter_watcher is not None:
+        chapter_watcher.cancel()
+    if cache_prewarmer is not None:
+        cache_prewarmer.cancel()
+    if model_warmup is not None:
+        model_warmup.cancel()
+    await query_log.close()
+    if ollama is not None:
+        await ollama.close()
+    simple_rag_system.shutdown()
+    answer_cache.close()
+
+def ndjson_event(event: dict) -> str:
+    return json.dumps(event) + "\n"
+
+def answer_metadata(model: str, source: str, sources: List[str] = None, book_ids: List[str] = None) -> dict:
+    """Everything in a QuestionResponse except the answer text"""
+    return {"model": model, "source": source, "sources": sources or [], "book_ids": book_ids or []}
+
+async def stream_answer(response: dict):
+    """Stream an already complete answer using the same event format"""
+    metadata = {key: value for key, value in response.items() if key != "answer"}
+    yield ndjson_event({"type": "token", "content": response["answer"]})
+    yield ndjson_event({"type": "done", **metadata})
+
+def build_rag_prompt(question: str, passages: List[dict]) -> str:
+    """Pack retrieved passages after the fixed instructions, question last"""
+    excerpts = "\n\n".join(
+        f"[{i}] {passage['book']}, {passage['title']}\n{passage['text']}" if passage.get('book')
+        else f"[{i}] {passage['title']}\n{passage['text']}"
+        for i, passage in enumerate(passages, 1)
+    )
+    return f"{RAG_INSTRUCTIONS}Book excerpts:\n\n{excerpts}\n\nQuestion: {question}\nAnswer:"
+
+def ollama_payload_for(prompt: str, preset: LatencyPreset) -> dict:
+    payload = {
+        "model": MODEL_NAME,
+        "prompt": prompt,
+        "keep_alive": preset.keep_alive or OLLAMA_KEEP_ALIVE
+    }
+    options = preset.options()
+    if options:
+        payload["options"] = options
+    return payload
+
+async def stream_ollama(chunks: AsyncIterator[dict], metadata: dict, cache_key: str = None,
+                        session: Session = None):
+    """
+    Proxy Ollama's token stream (from `ollama.open_stream`) as NDJSON events.
+
+    Emits `{"type": "token", "content": ...}` for every chunk, then a final
+    `{"type": "done", ...metadata}` (model, source, sources, book_ids). Failures
+    are raised to `observe_stream`, which reports them in-band. The complete
+    answer is stored under `cache_key` once the stream finishes, and the
+    returned context is kept for the session's next turn.
+    """
+    parts = []
+    async for chunk in chunks:
+        if chunk.get("response"):
+            parts.append(chunk["response"])
+            yield ndjson_event({"type": "token", "content": chunk["response"]})
+        if chunk.get("done") and session is not None:
+            sessions.record_turn(session, chunk)
+    
+    answer = "".join(parts)
+    if cache_key and answer:
+        await answer_cache.set(cache_key, {"answer": answer, **metadata})
+    yield ndjson_event({"type": "done", **metadata})
+
+def observe_request(route: str, outcome: str, started: float, cached: bool = False,
+                    request: Optional[QuestionRequest] = None):
+    """Record request metrics, and the question in the query log when one is given"""
+    seconds = time.perf_counter() - started
+    REQUESTS.inc(route=route, outcome=outcome)
+    REQUEST_SECONDS.observe(seconds, route=route, cached="true" if cached else "false")
+    if request is not None:
+        query_log.record(request.question, route, outcome, seconds, cached, request.latency,
+                         session=bool(request.session_id) and route != "book_rag")
+
+async def observe_stream(events, route: str, started: float, cached: bool = False,
+                         request: Optional[QuestionRequest] = None):
+    """
+    Pass NDJSON events through, recording the request once the stream has ended.
+    
+    The response has already started, so an error raised by the stream is sent
+    as a final `{"type": "error", ...}` event and recorded as the outcome.
+    """
+    outcome = "ok"
+    try:
+        async for event in events:
+            yield event
+    except OllamaError as e:
+        outcome = "error"
+        yield ndjson_event({"type": "error", "detail": e.detail})
+    except Exception as e:
+        outcome = "error"
+        logger.error(f"Streaming error: {e}")
+        yield ndjson_event({"type": "error", "detail": f"Internal server error: {str(e)}"})
+    observe_request(route, outcome, started, cached, request)
+
+def ndjson_response(events, route: str, started: float, cached: bool = False,
+                    request: Optional[QuestionRequest] = None) -> StreamingResponse:
+    return StreamingResponse(observe_stream(events, route, started, cached, request),
+                             media_type="application/x-ndjson")
 
 @app.get("/")
 async def root():
@@ -65,96 +313,230 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "model": MODEL_NAME}
+    return {
+        "status": "healthy",
+        "model": MODEL_NAME,
+        "rag_pool": simple_rag_system.pool_stats(),
+        "answer_cache": answer_cache.stats(),
+        "sessions": sessions.stats(),
+        "latency_presets": latency_presets.stats(),
+        "query_log": query_log.stats(),
+        "profiling": profiler.stats(),
+        "ollama": ollama.stats() if ollama is not None else None
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: request and stage latencies, Ollama token rates and load counts"""
+    IN_FLIGHT.set(ollama.stats()["in_flight"] if ollama is not None else 0, kind="ollama_generations")
+    IN_FLIGHT.set(simple_rag_system.pending, kind="rag_queries")
+    if ollama is not None:
+        IN_FLIGHT.set(ollama.admission.active, kind="generation_slots")
+        IN_FLIGHT.set(ollama.admission.queued, kind="queued_generations")
+    CACHE_ENTRIES.set(len(answer_cache.entries))
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+def require_admin(request: Request):
+    """Allow /admin calls that carry ADMIN_TOKEN, or come from loopback when none is set"""
+    if ADMIN_TOKEN:
+        if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+            raise HTTPException(status_code=401, detail="Missing or invalid X-Admin-Token")
+    elif request.client is None or request.client.host not in LOOPBACK_HOSTS:
+        raise HTTPException(status_code=403, detail="Admin endpoints are only served to localhost without ADMIN_TOKEN")
+
+@app.post("/admin/reload", dependencies=[Depends(require_admin)])
+async def reload_chapters():
+    """Apply added, changed and removed chapter files to the live index"""
+    try:
+        result = await reload_corpus()
+    except Exception as e:
+        logger.error(f"❌ Error reloading chapters: {e}")
+        raise HTTPException(status_code=500, detail=f"Reload failed: {str(e)}")
+    return {**result, "chapters": len(simple_rag_system.chapters), "corpus_version": simple_rag_system.corpus_version}
+
+@app.get("/admin/profiling", dependencies=[Depends(require_admin)])
+async def profiling_status():
+    return profiler.stats()
+
+@app.post("/admin/profiling", dependencies=[Depends(require_admin)])
+async def configure_profiling(settings: ProfilingSettings):
+    """Turn request profiling on or off and set the slow request threshold"""
+    profiler.configure(settings.enabled, settings.slow_ms)
+    return profiler.stats()
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """Stored request profiles, newest first"""
+    return {"profiles": await asyncio.get_running_loop().run_in_executor(None, profiler.list_profiles)}
+
+@app.get("/admin/profiles/{profile_id}", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def get_profile(profile_id: str):
+    """One profile as folded stacks, ready for flamegraph.pl or speedscope"""
+    folded = await asyncio.get_running_loop().run_in_executor(None, profiler.read_profile, profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Unknown profile")
+    return PlainTextResponse(folded)
+
+@app.delete("/sessions/{session_id}")
+async def end_session(session_id: str):
+    """Forget a conversation so its next question starts afresh"""
+    if not sessions.end(session_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return {"session_id": session_id, "ended": True}
+
+def answer_route(request: QuestionRequest) -> str:
+    if request.use_rag:
+        return "rag_llm" if request.augment else "book_rag"
+    return "ollama"
+
+def answer_cache_key(request: QuestionRequest, route: str, preset: LatencyPreset) -> str:
+    # Book answers are keyed on the corpus version too, so reloads invalidate them
+    corpus_version = simple_rag_system.corpus_version if route != "ollama" else ""
+    # Generated answers depend on the preset's options (book-only answers do not)
+    preset_name = preset.name if route != "book_rag" else ""
+    return make_cache_key(request.question, route, MODEL_NAME, corpus_version, preset_name)
+
+def resolve_preset(request: QuestionRequest, route: str) -> LatencyPreset:
+    try:
+        return latency_presets.resolve(request.latency, route)
+    except KeyError:
+        names = ", ".join(latency_presets.presets)
+        raise HTTPException(status_code=400, detail=f"Unknown latency preset '{request.latency}' (use {names})")
+
+def book_rag_response(rag_result: dict) -> dict:
+    return {
+        "answer": rag_result['answer'],
+        **answer_metadata("simple_rag", "book_rag", rag_result['sources'], rag_result['book_ids'])
+    }
+
+def rag_llm_prompt(question: str, context: Optional[dict]):
+    """Prompt and response metadata for retrieved context; the plain question if there is none"""
+    if not context or not context['passages']:
+        return question, answer_metadata(MODEL_NAME, "ollama")
+    logger.info(f"Packed {len(context['passages'])} passages from {len(context['sources'])} chapters")
+    return (build_rag_prompt(question, context['passages']),
+            answer_metadata(MODEL_NAME, "rag_llm", context['sources'], context['book_ids']))
+
+def session_payload_for(prompt: str, preset: LatencyPreset, session: Optional[Session]) -> dict:
+    payload = ollama_payload_for(prompt, preset)
+    return sessions.payload_for(session, payload) if session is not None else payload
+
+async def generate_answer(prompt: str, preset: LatencyPreset, metadata: dict, cache_key: Optional[str],
+                          priority: int = PRIORITY_INTERACTIVE, session: Session = None) -> dict:
+    """Run one complete Ollama generation and cache the response dict (session turns are not cached)"""
+    logger.info(f"Sending request to Ollama with model: {MODEL_NAME} ({preset.name})")
+    
+    ollama_response = await ollama.generate(session_payload_for(prompt, preset, session), priority)
+    answer = ollama_response.get("response", "")
+    
+    if not answer:
+        raise HTTPException(
+            status_code=500,
+            detail="Ollama returned empty response"
+        )
+    
+    logger.info(f"Successfully processed question, response length: {len(answer)}")
+    response = {"answer": answer, **metadata}
+    if session is not None:
+        sessions.record_turn(session, ollama_response)
+    elif cache_key:
+        await answer_cache.set(cache_key, response)
+    return response
 
 @app.post("/ask", response_model=QuestionResponse)
 async def ask_question(request: QuestionRequest):
     """
     Send a question to the local Ollama LLM or RAG system and return the response.
+    
+    With `stream=true` the answer is sent as newline-delimited JSON events
+    (see `stream_ollama`) instead of a single `QuestionResponse`.
     """
+    started = time.perf_counter()
+    route = answer_route(request)
+    try:
+        response = await answer_question(request, route, started)
+    except Exception:
+        observe_request(route, "error", started, request=request)
+        raise
+    if isinstance(response, QuestionResponse):
+        observe_request(route, "ok", started, response.cached, request)
+    return response
+
+async def answer_question(request: QuestionRequest, route: str, started: float):
+    """Answer one /ask request; streaming responses record their own metrics"""
     try:
         logger.info(f"Processing question: {request.question[:50]}...")
+        preset = resolve_preset(request, route)
+        
+        # A session turn depends on the conversation so far, so it skips the cache
+        session = None
+        if request.session_id and route != "book_rag":
+            session = sessions.get(request.session_id)
+        
+        # Repeated questions are answered without touching Ollama or the RAG index
+        cache_key = answer_cache_key(request, route, preset) if session is None else None
+        cached = await answer_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            logger.info("Answer cache hit")
+            if request.stream:
+                return ndjson_response(stream_answer(cached), route, started, True, request)
+            return QuestionResponse(**cached, cached=True)
+        
+        # Retrieval-augmented generation: book passages packed into the LLM prompt
+        prompt = request.question
+        metadata = answer_metadata(MODEL_NAME, "ollama")
+        if route == "rag_llm":
+            logger.info("Retrieving book passages for the LLM prompt")
+            try:
+                context = await aretrieve_context_simple_rag(request.question)
+                prompt, metadata = rag_llm_prompt(request.question, context)
+            except Exception as rag_error:
+                logger.error(f"RAG error: {rag_error}")
+                logger.info("Falling back to the plain question")
+            # Without book passages this is a plain Ollama answer and is cached as one
+            if metadata["source"] == "ollama" and cache_key:
+                cache_key = answer_cache_key(request, "ollama", preset)
         
         # If RAG is requested and available, use it
-        if request.use_rag:
+        elif request.use_rag:
             logger.info("Using simple RAG system for book-specific answer")
             try:
-                rag_answer = query_simple_rag(request.question)
-                return QuestionResponse(
-                    answer=rag_answer,
-                    model="simple_rag",
-                    source="book_rag"
-                )
+                rag_response = book_rag_response(await aanswer_simple_rag(request.question))
+                if simple_rag_system.is_initialized:
+                    await answer_cache.set(cache_key, rag_response)
+                if request.stream:
+                    return ndjson_response(stream_answer(rag_response), route, started, request=request)
+                return QuestionResponse(**rag_response)
             except Exception as rag_error:
                 logger.error(f"RAG error: {rag_error}")
-                # Fall back to Ollama if RAG fails
+                # Fall back to Ollama if RAG fails, caching the answer as an
+                # Ollama one so the book answer is tried again next time
                 logger.info("Falling back to Ollama")
+                cache_key = answer_cache_key(request, "ollama", preset)
         
         # Use Ollama for general questions or as fallback
         logger.info("Using Ollama for general answer")
+        metadata = {**metadata, "latency": preset.name}
+        if session is not None:
+            metadata = {**metadata, "session_id": session.session_id}
         
-        async with httpx.AsyncClient(timeout=200.0) as client:
-            ollama_payload = {
-                "model": MODEL_NAME,
-                "prompt": request.question,
-                "stream": False
-            }
-            
-            logger.info(f"Sending request to Ollama with model: {MODEL_NAME}")
-            
-            response = await client.post(
-                f"{OLLAMA_URL}/api/generate",
-                json=ollama_payload
-            )
-            
-            logger.info(f"Ollama response status: {response.status_code}")
-            
-            if response.status_code != 200:
-                error_detail = f"Ollama API error: {response.status_code}"
-                try:
-                    error_response = response.json()
-                    error_detail += f" - {error_response}"
-                except:
-                    pass
-                raise HTTPException(status_code=500, detail=error_detail)
-            
-            try:
-                ollama_response = response.json()
-                answer = ollama_response.get("response", "")
-                
-                if not answer:
-                    raise HTTPException(
-                        status_code=500,
-                        detail="Ollama returned empty response"
-                    )
-                
-                logger.info(f"Successfully processed question, response length: {len(answer)}")
-                
-                return QuestionResponse(
-                    answer=answer,
-                    model=MODEL_NAME,
-                    source="ollama"
-                )
-                
-            except Exception as json_error:
-                logger.error(f"Error parsing Ollama response: {json_error}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Error parsing Ollama response: {str(json_error)}"
-                )
-            
-    except httpx.ConnectError as e:
-        logger.error(f"Connection error to Ollama: {e}")
-        raise HTTPException(
-            status_code=503,
-            detail="Cannot connect to Ollama. Make sure Ollama is running on localhost:11434"
-        )
-    except httpx.TimeoutException as e:
-        logger.error(f"Timeout error: {e}")
-        raise HTTPException(
-            status_code=504,
-            detail="Request to Ollama timed out. Try again."
-        )
+        if request.stream:
+            # Admission happens here, so a shed request still gets a proper 429/503
+            chunks = await ollama.open_stream(session_payload_for(prompt, preset, session))
+            return ndjson_response(stream_ollama(chunks, metadata, cache_key, session), route, started,
+                                   request=request)
+        
+        return QuestionResponse(**await generate_answer(prompt, preset, metadata, cache_key, session=session))
+        
+    except AdmissionError as e:
+        logger.warning(f"Shed request: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail,
+                            headers={"Retry-After": str(e.retry_after)})
+    except OllamaError as e:
+        logger.error(f"Ollama error: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         raise HTTPException(
@@ -162,6 +544,173 @@ async def ask_question(request: QuestionRequest):
             detail=f"Internal server error: {str(e)}"
         )
 
+def batch_error(index: int, error: Exception) -> BatchItem:
+    if isinstance(error, AdmissionError):
+        return BatchItem(index=index, error=error.detail, status_code=error.status_code,
+                         retry_after=error.retry_after)
+    if isinstance(error, OllamaError):
+        return BatchItem(index=index, error=error.detail, status_code=error.status_code)
+    if isinstance(error, HTTPException):
+        return BatchItem(index=index, error=str(error.detail), status_code=error.status_code)
+    logger.error(f"Unexpected batch error: {error}")
+    return BatchItem(index=index, error=f"Internal server error: {str(error)}", status_code=500)
+
+async def batch_generate(prompt: str, preset: LatencyPreset, metadata: dict, cache_key: str) -> dict:
+    async with batch_slots:
+        return await generate_answer(prompt, preset, {**metadata, "latency": preset.name}, cache_key, PRIORITY_BATCH)
+
+async def batch_result(index: int, generation: asyncio.Future) -> BatchItem:
+    try:
+        return BatchItem(index=index, response=QuestionResponse(**await generation))
+    except Exception as e:
+        return batch_error(index, e)
+
+async def run_batch(questions: List[QuestionRequest], observe: bool = True) -> AsyncIterator[BatchItem]:
+    """
+    Answer a batch, yielding each BatchItem as soon as it is ready.
+    
+    Cache lookups come first, then every book lookup of the batch runs in one
+    bulk call spread over the RAG pool, then the Ollama generations run with at
+    most BATCH_CONCURRENCY in flight. Failures become per-item errors.
+    With `observe=False` nothing is recorded in metrics or the query log.
+    """
+    started = time.perf_counter()
+    routes = [answer_route(request) for request in questions]
+    
+    def finished(item: BatchItem) -> BatchItem:
+        if observe:
+            cached = item.response is not None and item.response.cached
+            observe_request(routes[item.index], "ok" if item.error is None else "error", started, cached,
+                            questions[item.index])
+        return item
+    
+    book_rag, rag_llm, generations = [], [], []
+    presets = {}
+    for index, request in enumerate(questions):
+        route = routes[index]
+        try:
+            presets[index] = resolve_preset(request, route)
+        except HTTPException as e:
+            yield finished(batch_error(index, e))
+            continue
+        cache_key = answer_cache_key(request, route, presets[index])
+        cached = await answer_cache.get(cache_key)
+        if cached is not None:
+            yield finished(BatchItem(index=index, response=QuestionResponse(**cached, cached=True)))
+        elif route == "book_rag":
+            book_rag.append((index, request.question, cache_key))
+        elif route == "rag_llm":
+            rag_llm.append((index, request.question, cache_key))
+        else:
+            generations.append((index, request.question, answer_metadata(MODEL_NAME, "ollama"), cache_key))
+    
+    rag_results, contexts = await asyncio.gather(
+        aanswer_many_simple_rag([question for _, question, _ in book_rag]),
+        aretrieve_context_many_simple_rag([question for _, question, _ in rag_llm]),
+        return_exceptions=True
+    )
+    
+    if isinstance(rag_results, Exception):
+        logger.error(f"RAG error: {rag_results}")
+        logger.info("Falling back to Ollama")
+        rag_results = [None] * len(book_rag)
+    for (index, question, cache_key), rag_result in zip(book_rag, rag_results):
+        if rag_result is None:
+            # Keyed as an Ollama answer, so the book answer is tried again next time
+            generations.append((index, question, answer_metadata(MODEL_NAME, "ollama"),
+                                answer_cache_key(questions[index], "ollama", presets[index])))
+            continue
+        rag_response = book_rag_response(rag_result)
+        if simple_rag_system.is_initialized:
+            await answer_cache.set(cache_key, rag_response)
+        yield finished(BatchItem(index=index, response=QuestionResponse(**rag_response)))
+    
+    if isinstance(contexts, Exception):
+        logger.error(f"RAG error: {contexts}")
+        logger.info("Falling back to the plain question")
+        contexts = [None] * len(rag_llm)
+    for (index, question, cache_key), context in zip(rag_llm, contexts):
+        prompt, metadata = rag_llm_prompt(question, context)
+        if metadata["source"] == "ollama":
+            cache_key = answer_cache_key(questions[index], "ollama", presets[index])
+        generations.append((index, prompt, metadata, cache_key))
+    
+    # Repeats of a question within the batch share one generation
+    shared = {}
+    tasks = []
+    for index, prompt, metadata, cache_key in generations:
+        if cache_key not in shared:
+            shared[cache_key] = asyncio.ensure_future(batch_generate(prompt, presets[index], metadata, cache_key))
+        tasks.append(asyncio.ensure_future(batch_result(index, shared[cache_key])))
+    try:
+        for next_item in asyncio.as_completed(tasks):
+            yield finished(await next_item)
+    finally:
+        # Client went away mid-stream: don't keep generating for it
+        for task in tasks + list(shared.values()):
+            task.cancel()
+
+async def prewarm_answer_cache():
+    """Answer the most frequent recent questions so the cache is warm before traffic peaks"""
+    loop = asyncio.get_running_loop()
+    try:
+        frequent = await loop.run_in_executor(None, query_log.top_questions, CACHE_PREWARM_COUNT,
+                                              CACHE_PREWARM_WINDOW)
+    except Exception as e:
+        logger.error(f"❌ Error reading the query log: {e}")
+        return
+    # Every worker warms its own memory tier with book answers, which only
+    # read the local index. Ollama generations are replayed by one worker;
+    # the others see those answers through the disk tier (ANSWER_CACHE_DB).
+    generate = CACHE_PREWARM_GENERATE and query_log.claim_replay()
+    questions = [
+        QuestionRequest(question=question, use_rag=route != "ollama", augment=route == "rag_llm", latency=latency)
+        for question, route, latency, _ in frequent
+        if route == "book_rag" or generate
+    ]
+    if not questions:
+        return
+    
+    logger.info(f"🔥 Pre-warming the answer cache with {len(questions)} frequent questions")
+    started = time.perf_counter()
+    counts = {"answered": 0, "cached": 0, "failed": 0}
+    # Generations run at batch priority, so live /ask requests go first
+    async for item in run_batch(questions, observe=False):
+        if item.error is not None:
+            counts["failed"] += 1
+        elif item.response.cached:
+            counts["cached"] += 1
+        else:
+            counts["answered"] += 1
+    logger.info(f"🔥 Answer cache pre-warmed in {time.perf_counter() - started:.1f}s: "
+                f"{counts['answered']} answered, {counts['cached']} already cached, {counts['failed']} failed")
+
+async def stream_batch(questions: List[QuestionRequest]):
+    async for item in run_batch(questions):
+        yield item.model_dump_json() + "\n"
+
+@app.post("/ask/batch", response_model=BatchResponse)
+async def ask_batch(request: BatchRequest):
+    """
+    Answer many questions in one call.
+    
+    Results come back in request order, or with `stream=true` as one NDJSON
+    `BatchItem` per line in completion order. A failed question is reported in
+    its item's `error`/`status_code`; the rest of the batch is unaffected.
+    """
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many questions in one batch (max {BATCH_MAX_QUESTIONS})"
+        )
+    logger.info(f"Processing batch of {len(request.questions)} questions")
+    
+    if request.stream:
+        return StreamingResponse(stream_batch(request.questions), media_type="application/x-ndjson")
+    
+    results = [item async for item in run_batch(request.questions)]
+    return BatchResponse(results=sorted(results, key=lambda item: item.index))
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
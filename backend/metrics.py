@@ -0,0 +1,190 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+# Latency buckets in seconds, from a cache hit up to a long generation
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1000, 2000)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+
+    def label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # label values -> [per-bucket counts, sum, count]
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of a block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+                labels = _format_labels(self.label_names, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """All metrics of the process, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global registry
+registry = MetricsRegistry()
+
+# /ask and /ask/batch
+REQUESTS = registry.counter(
+    "askafrica_requests_total", "Answered questions by route and outcome", ["route", "outcome"])
+REQUEST_SECONDS = registry.histogram(
+    "askafrica_request_duration_seconds", "Time to answer a question, by route", ["route", "cached"])
+
+# Pipeline stages: cache_lookup, rag_pool, chapter_search, snippet_extraction,
+# context_packing, first_token and generation
+STAGE_SECONDS = registry.histogram(
+    "askafrica_stage_duration_seconds", "Time spent in each stage of answering", ["stage"])
+
+# Ollama's own accounting from the final /api/generate chunk
+OLLAMA_GENERATIONS = registry.counter(
+    "askafrica_ollama_generations_total", "Upstream generations by result", ["model", "result"])
+OLLAMA_TOKENS = registry.counter(
+    "askafrica_ollama_tokens_total", "Tokens processed by Ollama (prompt or eval)", ["model", "kind"])
+OLLAMA_SECONDS = registry.counter(
+    "askafrica_ollama_duration_seconds_total", "Ollama-reported time by phase (load, prompt_eval, eval)",
+    ["model", "phase"])
+OLLAMA_TOKENS_PER_SECOND = registry.histogram(
+    "askafrica_ollama_tokens_per_second", "Ollama throughput per generation (prompt_eval or eval)",
+    ["model", "phase"], RATE_BUCKETS)
+OLLAMA_MODEL_LOADS = registry.counter(
+    "askafrica_ollama_model_loads_total", "Generations that had to load the model first", ["model"])
+
+# Admission control in front of Ollama (queue_full -> 429, queue_timeout -> 503)
+ADMISSION_REJECTIONS = registry.counter(
+    "askafrica_admission_rejections_total", "Generations shed by admission control", ["reason"])
+
+# Conversation sessions: prior-turn context passed back instead of the transcript
+SESSION_CONTEXT_TOKENS = registry.counter(
+    "askafrica_session_context_tokens_reused_total", "Context tokens carried over from earlier session turns")
+
+# Request profiles written to PROFILE_DIR (header = asked for, slow = over PROFILE_SLOW_MS)
+PROFILES_CAPTURED = registry.counter(
+    "askafrica_profiles_captured_total", "Request profiles saved", ["trigger"])
+
+# Point-in-time values, refreshed when /metrics is scraped
+IN_FLIGHT = registry.gauge(
+    "askafrica_in_flight", "Work in progress (ollama_generations, generation_slots, queued_generations, rag_queries)", ["kind"])
+CACHE_ENTRIES = registry.gauge("askafrica_answer_cache_entries", "Answers held in memory")
@@ -0,0 +1,421 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional, Set, Union
+
+import httpx
+
+from admission import AdmissionController, PRIORITY_INTERACTIVE
+from metrics import (
+    OLLAMA_GENERATIONS, OLLAMA_MODEL_LOADS, OLLAMA_SECONDS, OLLAMA_TOKENS, OLLAMA_TOKENS_PER_SECOND, STAGE_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Connection pool settings for the shared Ollama client
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "10"))
+OLLAMA_MAX_KEEPALIVE = int(os.getenv("OLLAMA_MAX_KEEPALIVE", "5"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "60"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "200"))
+
+# A load_duration above this means Ollama had to (re)load the model
+MODEL_LOAD_SECONDS = 0.5
+
+# Upstream health: seconds between /api/tags probes (0 disables them), probe
+# timeout, and how long an upstream that failed to connect is skipped
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+OLLAMA_PROBE_TIMEOUT = float(os.getenv("OLLAMA_PROBE_TIMEOUT", "2"))
+OLLAMA_EJECT_SECONDS = float(os.getenv("OLLAMA_EJECT_SECONDS", "30"))
+
+
+class OllamaError(Exception):
+    """Upstream failure, carrying the HTTP status /ask should answer with"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def create_http_client(base_url: str) -> httpx.AsyncClient:
+    """Create the pooled keep-alive client used for every Ollama call"""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        limits=httpx.Limits(
+            max_connections=OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=OLLAMA_MAX_KEEPALIVE,
+            keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY,
+        ),
+        # Waiting for a free pooled connection counts against the connect timeout
+        timeout=httpx.Timeout(
+            OLLAMA_READ_TIMEOUT,
+            connect=OLLAMA_CONNECT_TIMEOUT,
+            pool=OLLAMA_CONNECT_TIMEOUT,
+        ),
+    )
+
+
+class Upstream:
+    """One Ollama server: its pooled client, load and health"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.http = create_http_client(base_url)
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.models: Set[str] = set()  # from the last probe; empty = unknown
+        self.last_error: Optional[str] = None
+
+    def available(self, now: float) -> bool:
+        """Healthy, or ejected long enough ago to be worth another try"""
+        return self.healthy or now >= self.ejected_until
+
+    def has_model(self, model: str) -> bool:
+        return not self.models or model in self.models or f"{model}:latest" in self.models
+
+    def mark_failed(self, error: str):
+        self.failures += 1
+        self.healthy = False
+        self.ejected_until = time.monotonic() + OLLAMA_EJECT_SECONDS
+        self.last_error = error
+
+    def mark_healthy(self):
+        self.healthy = True
+        self.ejected_until = 0.0
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.base_url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "models": sorted(self.models),
+            "last_error": self.last_error,
+        }
+
+
+class GenerationBroadcast:
+    """
+    Fan-out of one upstream generation to any number of subscribers.
+
+    Chunks are kept for the lifetime of the generation, so a subscriber that
+    joins late still replays the answer from its first token.
+    """
+
+    def __init__(self):
+        self.chunks: List[Dict] = []
+        self.finished = False
+        self.error: Optional[Exception] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.changed = asyncio.Event()
+
+    def publish(self, chunk: Dict):
+        self.chunks.append(chunk)
+        self.changed.set()
+
+    def finish(self, error: Optional[Exception] = None):
+        self.finished = True
+        self.error = error
+        self.changed.set()
+
+    def subscribe(self) -> "Subscription":
+        """A new subscriber, counted from now until its iterator is done or closed"""
+        self.subscribers += 1
+        return Subscription(self)
+
+    def unsubscribe(self):
+        self.subscribers -= 1
+        # Nobody is listening any more: stop spending Ollama time on it
+        if self.subscribers == 0 and not self.finished and self.task is not None:
+            self.task.cancel()
+
+    async def replay(self) -> AsyncIterator[Dict]:
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            self.changed.clear()
+            await self.changed.wait()
+
+
+class Subscription:
+    """
+    Async iterator over a GenerationBroadcast for one subscriber.
+
+    The subscriber is counted from the moment it is handed out, not from its
+    first chunk, so a generation is not cancelled while someone still holds a
+    stream they have yet to start reading. It is released once the stream
+    ends or fails, on aclose(), or at the latest when it is garbage collected.
+    """
+
+    def __init__(self, broadcast: GenerationBroadcast):
+        self.broadcast = broadcast
+        self.chunks = broadcast.replay()
+        self.released = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict:
+        try:
+            return await self.chunks.__anext__()
+        except BaseException:
+            self.release()
+            raise
+
+    async def aclose(self):
+        try:
+            await self.chunks.aclose()
+        finally:
+            self.release()
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.broadcast.unsubscribe()
+
+    def __del__(self):
+        try:
+            self.release()
+        except RuntimeError:  # the event loop is already closed
+            pass
+
+
+def record_generation_stats(chunk: Dict):
+    """Turn the durations (nanoseconds) and counts of a final chunk into metrics"""
+    model = chunk.get("model", "")
+    load_seconds = chunk.get("load_duration", 0) / 1e9
+    OLLAMA_SECONDS.inc(load_seconds, model=model, phase="load")
+    if load_seconds > MODEL_LOAD_SECONDS:
+        OLLAMA_MODEL_LOADS.inc(model=model)
+
+    for phase, count_field, duration_field in (("prompt_eval", "prompt_eval_count", "prompt_eval_duration"),
+                                               ("eval", "eval_count", "eval_duration")):
+        count = chunk.get(count_field, 0)
+        seconds = chunk.get(duration_field, 0) / 1e9
+        OLLAMA_TOKENS.inc(count, model=model, kind=phase)
+        OLLAMA_SECONDS.inc(seconds, model=model, phase=phase)
+        if count and seconds > 0:
+            OLLAMA_TOKENS_PER_SECOND.observe(count / seconds, model=model, phase=phase)
+
+
+class OllamaClient:
+    """
+    Shared client for Ollama's /api/generate.
+
+    Every generation is requested upstream in streaming mode and published
+    through a GenerationBroadcast. Concurrent requests with the same payload
+    (model, prompt, options) attach to the in-flight broadcast instead of
+    starting another generation. Only new generations need a slot from the
+    admission controller; attaching to one in flight is free.
+
+    With several base URLs each generation goes to the available upstream
+    with the fewest outstanding requests that serves the model. An upstream
+    that refuses the connection is ejected for OLLAMA_EJECT_SECONDS and the
+    generation is retried on another; periodic probes bring it back.
+    """
+
+    def __init__(self, base_urls: Union[str, List[str]], admission: Optional[AdmissionController] = None):
+        if isinstance(base_urls, str):
+            base_urls = [base_urls]
+        self.upstreams = [Upstream(base_url) for base_url in base_urls]
+        self.admission = admission or AdmissionController(max_concurrent=0)
+        self.in_flight: Dict[str, GenerationBroadcast] = {}
+        self.generations = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.health_task: Optional[asyncio.Task] = None
+
+    def start(self, health_interval: float = OLLAMA_HEALTH_INTERVAL):
+        """Start background health probes (call from a running event loop)"""
+        if health_interval > 0 and self.health_task is None:
+            self.health_task = asyncio.create_task(self._probe_forever(health_interval))
+
+    async def close(self):
+        if self.health_task is not None:
+            self.health_task.cancel()
+            self.health_task = None
+        for upstream in self.upstreams:
+            await upstream.http.aclose()
+
+    async def probe(self, upstream: Upstream):
+        """Check an upstream is up and learn which models it has"""
+        try:
+            response = await upstream.http.get("/api/tags", timeout=OLLAMA_PROBE_TIMEOUT)
+            response.raise_for_status()
+            upstream.models = {model["name"] for model in response.json().get("models", [])}
+            if not upstream.healthy:
+                logger.info(f"✅ Ollama upstream {upstream.base_url} is back")
+            upstream.mark_healthy()
+        except Exception as e:
+            if upstream.healthy:
+                logger.warning(f"⚠️  Ollama upstream {upstream.base_url} failed its health check: {e}")
+            upstream.mark_failed(f"health check: {e}")
+
+    async def _probe_forever(self, interval: float):
+        while True:
+            await asyncio.gather(*(self.probe(upstream) for upstream in self.upstreams))
+            await asyncio.sleep(interval)
+
+    async def warm_up(self, payload: Dict, timeout: float):
+        """Load the payload's model on every upstream (an empty prompt only loads it)"""
+        async def load(upstream: Upstream):
+            started = time.perf_counter()
+            try:
+                response = await upstream.http.post("/api/generate", json={**payload, "stream": False},
+                                                    timeout=timeout)
+                response.raise_for_status()
+                logger.info(f"🔥 Loaded {payload.get('model')} on {upstream.base_url} "
+                            f"in {time.perf_counter() - started:.1f}s")
+            except Exception as e:
+                logger.warning(f"⚠️  Could not warm up {payload.get('model')} on {upstream.base_url}: {e}")
+
+        await asyncio.gather(*(load(upstream) for upstream in self.upstreams))
+
+    def pick_upstream(self, model: str, exclude: Set[Upstream]) -> Optional[Upstream]:
+        """Least outstanding requests among available upstreams that have the model"""
+        candidates = [upstream for upstream in self.upstreams if upstream not in exclude]
+        now = time.monotonic()
+        for usable in (
+            lambda upstream: upstream.available(now) and upstream.has_model(model),
+            lambda upstream: upstream.available(now),
+            lambda upstream: True,  # everything is ejected: try anyway rather than fail outright
+        ):
+            preferred = [upstream for upstream in candidates if usable(upstream)]
+            if preferred:
+                return min(preferred, key=lambda upstream: (upstream.outstanding, upstream.requests))
+        return None
+
+    @staticmethod
+    def generation_key(payload: Dict) -> str:
+        return json.dumps({k: v for k, v in payload.items() if k != "stream"}, sort_keys=True)
+
+    async def open_stream(self, payload: Dict, priority: int = PRIORITY_INTERACTIVE) -> AsyncIterator[Dict]:
+        """
+        Admit a generation and return an iterator over Ollama's raw stream chunks.
+
+        Raises AdmissionError right away if the request is shed; the iterator
+        raises OllamaError if the generation itself fails.
+        """
+        key = self.generation_key(payload)
+        broadcast = self.in_flight.get(key)
+        if broadcast is None:
+            admitted_at = await self.admission.acquire(priority)
+            # An identical generation may have started while we were queued
+            broadcast = self.in_flight.get(key)
+            if broadcast is None:
+                broadcast = GenerationBroadcast()
+                self.in_flight[key] = broadcast
+                self.generations += 1
+                broadcast.task = asyncio.create_task(self._run(key, payload, broadcast, admitted_at))
+                return broadcast.subscribe()
+            self.admission.release(admitted_at)
+        self.coalesced += 1
+        logger.info("Coalesced request onto in-flight Ollama generation")
+        return broadcast.subscribe()
+
+    async def generate(self, payload: Dict, priority: int = PRIORITY_INTERACTIVE) -> Dict:
+        """Collect a whole generation into one response dict like stream=false returns"""
+        parts = []
+        final: Dict = {}
+        async for chunk in await self.open_stream(payload, priority):
+            if chunk.get("response"):
+                parts.append(chunk["response"])
+            if chunk.get("done"):
+                final = chunk
+        return {**final, "response": "".join(parts)}
+
+    async def _stream_from(self, upstream: Upstream, payload: Dict, broadcast: GenerationBroadcast,
+                           started: float):
+        upstream.outstanding += 1
+        upstream.requests += 1
+        try:
+            async with upstream.http.stream("POST", "/api/generate", json={**payload, "stream": True}) as response:
+                if response.status_code != 200:
+                    error_body = (await response.aread()).decode("utf-8", errors="replace")
+                    raise OllamaError(500, f"Ollama API error: {response.status_code} - {error_body}")
+
+                first_token = True
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise OllamaError(500, f"Ollama API error: {chunk['error']}")
+                    if first_token and chunk.get("response"):
+                        STAGE_SECONDS.observe(time.perf_counter() - started, stage="first_token")
+                        first_token = False
+                    broadcast.publish(chunk)
+                    if chunk.get("done"):
+                        record_generation_stats(chunk)
+                        break
+        finally:
+            upstream.outstanding -= 1
+
+    async def _run(self, key: str, payload: Dict, broadcast: GenerationBroadcast, admitted_at: float):
+        started = time.perf_counter()
+        result = "error"
+        tried: Set[Upstream] = set()
+        try:
+            while True:
+                upstream = self.pick_upstream(payload.get("model", ""), tried)
+                tried.add(upstream)
+                try:
+                    await self._stream_from(upstream, payload, broadcast, started)
+                    break
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    # Nothing was sent yet, so another upstream can take the generation
+                    upstream.mark_failed(f"connect: {e}")
+                    logger.error(f"Connection error to Ollama at {upstream.base_url}: {e}")
+                    if len(tried) == len(self.upstreams):
+                        raise
+                    self.retries += 1
+                    logger.info("Retrying generation on another Ollama upstream")
+            result = "ok"
+            broadcast.finish()
+        except OllamaError as e:
+            broadcast.finish(e)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            urls = ", ".join(upstream.base_url for upstream in self.upstreams)
+            broadcast.finish(OllamaError(
+                503, f"Cannot connect to Ollama. Make sure Ollama is running on {urls}"
+            ))
+        except httpx.TimeoutException as e:
+            logger.error(f"Timeout error: {e}")
+            broadcast.finish(OllamaError(504, "Request to Ollama timed out. Try again."))
+        except asyncio.CancelledError:
+            result = "cancelled"
+            broadcast.finish(OllamaError(499, "Generation cancelled"))
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected Ollama error: {e}")
+            broadcast.finish(OllamaError(500, f"Error reading Ollama response: {str(e)}"))
+        finally:
+            self.admission.release(admitted_at)
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="generation")
+            OLLAMA_GENERATIONS.inc(model=payload.get("model", ""), result=result)
+            if self.in_flight.get(key) is broadcast:
+                del self.in_flight[key]
+
+    def stats(self) -> Dict:
+        return {
+            "generations": self.generations,
+            "coalesced_requests": self.coalesced,
+            "in_flight": len(self.in_flight),
+            "retries": self.retries,
+            "admission": self.admission.stats(),
+            "upstreams": [upstream.stats() for upstream in self.upstreams],
+        }
@@ -1,120 +1,331 @@
 import PyPDF2
+import argparse
+import hashlib
+import json
 import re
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-def extract_text_from_pdf(pdf_path):
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+# Loose top-level chapter files superseded by a book directory are moved here
+# (glob skips dot directories, so the index no longer sees them)
+LEGACY_DIR = ".legacy"
+
+# Pages handed to a worker per task, and how many tasks may be in flight per
+# worker. Together they bound how much extracted text sits in memory.
+PAGES_PER_TASK = 16
+TASKS_PER_WORKER = 2
+
+# Chapter headings, in priority order: the first pattern that matches a line
+# wins. (Matching is case-insensitive, so "CHAPTER"/"PART" are covered too.)
+CHAPTER_PATTERNS = [
+    re.compile(r'Chapter\s+\d+[:\s]*([^\n]+)', re.IGNORECASE),  # Chapter 1: Introduction
+    re.compile(r'\d+\.\s*([^\n]+)', re.IGNORECASE),             # 1. Introduction
+    re.compile(r'Part\s+\d+[:\s]*([^\n]+)', re.IGNORECASE),     # Part 1: Basics
+]
+# Cheap single scan that rules out lines none of the patterns can match
+CHAPTER_HINT = re.compile(r'chapter|part|\d\.', re.IGNORECASE)
+
+def extract_page_range(pdf_path, start, end):
+    """Extract the text of pages [start, end) (runs in a worker process)"""
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[page_num].extract_text() for page_num in range(start, end)]
+
+def count_pages(pdf_path):
+    with open(pdf_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+def iter_pdf_pages(pdf_path, workers=None, page_count=None):
+    """
+    Yield (page_number, text) for every page, in order.
+
+    Page ranges are extracted in parallel across a process pool; only a
+    small window of ranges is in flight at once, so memory stays bounded.
+    """
+    if page_count is None:
+        page_count = count_pages(pdf_path)
+    print(f"📖 PDF has {page_count} pages")
+    workers = workers or os.cpu_count() or 1
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count))
+              for start in range(0, page_count, PAGES_PER_TASK)]
+    window = workers * TASKS_PER_WORKER
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = [executor.submit(extract_page_range, pdf_path, start, end)
+                   for start, end in ranges[:window]]
+        next_range = len(pending)
+        for start, _ in ranges:
+            pages = pending.pop(0).result()
+            if next_range < len(ranges):
+                pending.append(executor.submit(extract_page_range, pdf_path, *ranges[next_range]))
+                next_range += 1
+            for offset, page_text in enumerate(pages):
+                yield start + offset + 1, page_text
+
+def iter_text_lines(pages):
+    """Turn (page_number, text) pairs into the line stream of the whole book"""
+    yield ""
+    for page_num, page_text in pages:
+        yield f"--- Page {page_num} ---"
+        yield from page_text.split('\n')
+
+def extract_text_from_pdf(pdf_path, workers=None):
     """Extract text from PDF file"""
-    text = ""
     try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            print(f"📖 PDF has {len(pdf_reader.pages)} pages")
-            
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                text += f"\n--- Page {page_num + 1} ---\n{page_text}"
-                
+        text = '\n'.join(iter_text_lines(iter_pdf_pages(pdf_path, workers)))
         print(f"✅ Extracted {len(text)} characters from PDF")
         return text
     except Exception as e:
         print(f"❌ Error extracting text: {e}")
         return None
 
-def split_by_chapters(text):
-    """Split text by chapter headings"""
-    # Common chapter patterns
-    chapter_patterns = [
-        r'Chapter\s+\d+[:\s]*([^\n]+)',  # Chapter 1: Introduction
-        r'CHAPTER\s+\d+[:\s]*([^\n]+)',  # CHAPTER 1: INTRODUCTION
-        r'\d+\.\s*([^\n]+)',             # 1. Introduction
-        r'Part\s+\d+[:\s]*([^\n]+)',     # Part 1: Basics
-        r'PART\s+\d+[:\s]*([^\n]+)',     # PART 1: BASICS
-    ]
-    
-    chapters = []
-    current_chapter = ""
+def match_chapter_heading(line):
+    """Return the chapter title if the line is a chapter heading, else None"""
+    if not CHAPTER_HINT.search(line):
+        return None
+    for pattern in CHAPTER_PATTERNS:
+        match = pattern.search(line)
+        if match:
+            return match.group(1).strip() if match.group(1) else match.group(0)
+    return None
+
+def iter_chapters(lines):
+    """Yield chapters ({'title', 'content'}) from a line stream as each one closes"""
+    current_lines = []
     current_title = "Introduction"
-    
-    lines = text.split('\n')
-    
+
     for line in lines:
-        # Check if this line is a chapter heading
-        is_chapter = False
-        for pattern in chapter_patterns:
-            match = re.search(pattern, line, re.IGNORECASE)
-            if match:
-                # Save previous chapter
-                if current_chapter.strip():
-                    chapters.append({
-                        'title': current_title,
-                        'content': current_chapter.strip()
-                    })
-                
-                # Start new chapter
-                current_title = match.group(1).strip() if match.group(1) else match.group(0)
-                current_chapter = line + "\n"
-                is_chapter = True
-                print(f"📑 Found chapter: {current_title}")
-                break
-        
-        if not is_chapter:
-            current_chapter += line + "\n"
-    
-    # Add the last chapter
-    if current_chapter.strip():
-        chapters.append({
-            'title': current_title,
-            'content': current_chapter.strip()
-        })
-    
+        title = match_chapter_heading(line)
+        if title is None:
+            current_lines.append(line)
+            continue
+
+        # Emit the previous chapter
+        content = '\n'.join(current_lines).strip()
+        if content:
+            yield {'title': current_title, 'content': content}
+
+        # Start new chapter
+        current_title = title
+        current_lines = [line]
+        print(f"📑 Found chapter: {current_title}")
+
+    # Emit the last chapter
+    content = '\n'.join(current_lines).strip()
+    if content:
+        yield {'title': current_title, 'content': content}
+
+def split_by_chapters(text):
+    """Split text by chapter headings"""
+    chapters = list(iter_chapters(text.split('\n')))
     print(f"✅ Split into {len(chapters)} chapters")
     return chapters
 
+def chapter_filename(index, title):
+    return f"chapter_{index:02d}_{title.replace(' ', '_').replace(':', '').replace('/', '_')[:50]}.txt"
+
+def save_chapter(chapter, index, output_dir="data/chapters"):
+    """Write one chapter to its text file and return the filename"""
+    filename = chapter_filename(index, chapter['title'])
+    filepath = os.path.join(output_dir, filename)
+
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write(f"Title: {chapter['title']}\n")
+        f.write("=" * 50 + "\n")
+        f.write(chapter['content'])
+
+    print(f"💾 Saved: {filename}")
+    return filename
+
 def save_chapters_to_files(chapters, output_dir="data/chapters"):
-    """Save chapters to individual text files"""
+    """Save chapters to individual text files, returning the filenames"""
     os.makedirs(output_dir, exist_ok=True)
-    
+
+    filenames = []
     for i, chapter in enumerate(chapters):
-        filename = f"chapter_{i+1:02d}_{chapter['title'].replace(' ', '_').replace(':', '').replace('/', '_')[:50]}.txt"
-        filepath = os.path.join(output_dir, filename)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(f"Title: {chapter['title']}\n")
-            f.write("=" * 50 + "\n")
-            f.write(chapter['content'])
-        
-        print(f"💾 Saved: {filename}")
-    
-    print(f"✅ Saved {len(chapters)} chapters to {output_dir}/")
+        filenames.append(save_chapter(chapter, i + 1, output_dir))
+
+    print(f"✅ Saved {len(filenames)} chapters to {output_dir}/")
+    return filenames
+
+def make_book_id(pdf_path):
+    """Stable, filesystem-safe id derived from the PDF filename"""
+    return re.sub(r'[^a-z0-9]+', '_', Path(pdf_path).stem.lower()).strip('_')[:60] or "book"
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'books': {}}
+
+def save_manifest(manifest, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def staging_dir(book_dir, suffix):
+    """Hidden sibling of book_dir, which the chapter loader and watcher skip"""
+    parent, name = os.path.split(os.path.normpath(book_dir))
+    return os.path.join(parent, f".{name}.{suffix}")
+
+def replace_dir(new_dir, book_dir):
+    """Move new_dir into book_dir's place; the old book_dir is deleted"""
+    old_dir = staging_dir(book_dir, "old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.isdir(book_dir):
+        os.replace(book_dir, old_dir)
+    os.replace(new_dir, book_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def ingest_pdf(pdf_path, book_dir, workers=None):
+    """
+    Extract one PDF into chapter files under book_dir; returns (page_count, filenames).
+
+    The chapters are written to a hidden sibling directory that replaces
+    book_dir only once extraction succeeded with at least one chapter, so a
+    running server (or its watcher) never indexes a half-written book and a
+    failed extraction leaves the previous one in place.
+    """
+    page_count = count_pages(pdf_path)
+    new_dir = staging_dir(book_dir, "new")
+    shutil.rmtree(new_dir, ignore_errors=True)
+    try:
+        # Pages stream in order from the worker pool straight into the
+        # chapter splitter; each chapter is written as soon as it closes.
+        lines = iter_text_lines(iter_pdf_pages(pdf_path, workers, page_count))
+        filenames = save_chapters_to_files(iter_chapters(lines), new_dir)
+        if filenames:
+            replace_dir(new_dir, book_dir)
+    finally:
+        shutil.rmtree(new_dir, ignore_errors=True)
+    return page_count, filenames
+
+def retire_loose_chapters(filenames, output_dir):
+    """
+    Move loose chapter files in output_dir that a book's own directory now
+    holds into output_dir/.legacy/.
+
+    Installs from before per-book directories have the Crash Course chapters
+    directly in data/chapters; once that PDF is ingested as a book they would
+    otherwise be indexed twice, once under the default book.
+    """
+    legacy_dir = os.path.join(output_dir, LEGACY_DIR)
+    moved = 0
+    for filename in filenames:
+        loose_path = os.path.join(output_dir, filename)
+        if os.path.isfile(loose_path):
+            os.makedirs(legacy_dir, exist_ok=True)
+            os.replace(loose_path, os.path.join(legacy_dir, filename))
+            moved += 1
+    if moved:
+        print(f"📦 Moved {moved} loose chapter file(s) now in a book directory to {legacy_dir}/")
+    return moved
+
+def ingest_library(pdf_dir="data", output_dir="data/chapters", workers=None, prune=False):
+    """
+    Ingest every PDF in pdf_dir into output_dir/<book_id>/.
+
+    A manifest records each book's source hash, page count and chapter files.
+    Unchanged PDFs (same size and mtime, or same hash) are skipped, so
+    re-running over an unchanged library only costs a directory listing.
+    """
+    manifest = load_manifest(output_dir)
+    books = manifest['books']
+    seen = set()
+    changed = 0
+
+    for pdf_path in sorted(Path(pdf_dir).glob("*.pdf")):
+        book_id = make_book_id(pdf_path)
+        seen.add(book_id)
+        stat = pdf_path.stat()
+        entry = books.get(book_id)
+
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            print(f"⏭️  Unchanged: {pdf_path.name}")
+            retire_loose_chapters(entry['chapters'], output_dir)
+            continue
+        sha256 = file_sha256(pdf_path)
+        if entry and entry['sha256'] == sha256:
+            # Touched but identical: just refresh the fingerprint
+            entry['size'], entry['mtime_ns'] = stat.st_size, stat.st_mtime_ns
+            print(f"⏭️  Unchanged (same hash): {pdf_path.name}")
+            retire_loose_chapters(entry['chapters'], output_dir)
+            continue
+
+        print(f"🔄 Ingesting {pdf_path.name} as book '{book_id}'...")
+        book_dir = os.path.join(output_dir, book_id)
+        try:
+            page_count, filenames = ingest_pdf(str(pdf_path), book_dir, workers)
+        except Exception as e:
+            print(f"❌ Error converting {pdf_path.name}: {e}")
+            continue
+        if not filenames:
+            print(f"❌ No chapters found in {pdf_path.name}")
+            continue
+
+        # The book directory now holds exactly the new chapters; record them
+        # only after that swap
+        retire_loose_chapters(filenames, output_dir)
+
+        books[book_id] = {
+            'title': pdf_path.stem,
+            'source': str(pdf_path),
+            'sha256': sha256,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'page_count': page_count,
+            'chapters': filenames,
+        }
+        changed += 1
+        save_manifest(manifest, output_dir)
+
+    if prune:
+        for book_id in sorted(set(books) - seen):
+            print(f"🗑️  Removing book '{book_id}' (source PDF is gone)")
+            book_dir = os.path.join(output_dir, book_id)
+            for filename in books[book_id]['chapters']:
+                try:
+                    os.remove(os.path.join(book_dir, filename))
+                except OSError:
+                    pass
+            del books[book_id]
+            changed += 1
+
+    save_manifest(manifest, output_dir)
+    print(f"🎉 Library ingestion complete: {changed} book(s) updated, {len(books)} in library")
+    return changed
 
 def main():
-    """Main function to convert PDF to text and split by chapters"""
-    pdf_path = "data/Python Crash Course, 3rd Edition A Hands-On, Pr.pdf"
-    
-    if not os.path.exists(pdf_path):
-        print(f"❌ PDF file not found: {pdf_path}")
-        return
-    
-    print("🔄 Converting PDF to text...")
-    text = extract_text_from_pdf(pdf_path)
-    
-    if not text:
-        print("❌ Failed to extract text from PDF")
-        return
-    
-    print("🔄 Splitting by chapters...")
-    chapters = split_by_chapters(text)
-    
-    if not chapters:
-        print("❌ Failed to split into chapters")
+    """Convert every PDF in a directory to chapter text files"""
+    parser = argparse.ArgumentParser(description="Ingest a directory of PDF books into chapter files")
+    parser.add_argument("pdf_dir", nargs="?", default="data", help="directory containing PDF books")
+    parser.add_argument("--output", default="data/chapters", help="chapter output directory")
+    parser.add_argument("--workers", type=int, default=None, help="extraction processes (default: CPU count)")
+    parser.add_argument("--prune", action="store_true", help="remove books whose PDF no longer exists")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.pdf_dir):
+        print(f"❌ PDF directory not found: {args.pdf_dir}")
         return
-    
-    print("🔄 Saving chapters to files...")
-    save_chapters_to_files(chapters)
-    
-    print("🎉 PDF conversion complete!")
-    print(f"📁 Chapters saved in: data/chapters/")
+
+    ingest_library(args.pdf_dir, args.output, args.workers, args.prune)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
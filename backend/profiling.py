@@ -0,0 +1,247 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from metrics import PROFILES_CAPTURED
+
+logger = logging.getLogger(__name__)
+
+# Off by default: while disabled the middleware passes requests straight
+# through and no sampler thread exists. When enabled, requests sent with
+# "X-Profile: 1" are always kept, and any other request slower than
+# PROFILE_SLOW_MS (0 = only on request) is kept automatically.
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "0").lower() in ("1", "true", "yes")
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "1000"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))  # seconds between stack samples
+PROFILE_MAX_SAMPLES = 50000  # ring buffer shared by all requests in flight
+
+PROFILED_PATHS = ("/ask", "/ask/batch")
+PROFILE_HEADER = b"x-profile"
+
+# Worker threads parked on these calls are idle, not working for a request
+IDLE_LEAVES = {("threading.py", "wait"), ("queue.py", "get"), ("thread.py", "_worker")}
+
+
+class StackSampler:
+    """
+    Samples every thread's Python stack at a fixed interval into a ring buffer.
+
+    The thread only runs while at least one capture is open. A capture reads
+    back the samples taken between its start and end as folded stacks
+    ("thread;outer;inner count"), the input format of flamegraph.pl and
+    speedscope. Requests running at the same time share samples.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, max_samples: int = PROFILE_MAX_SAMPLES):
+        self.interval = interval
+        self.samples: Deque[Tuple[float, Tuple[str, ...]]] = deque(maxlen=max_samples)
+        self.labels: Dict[object, str] = {}
+        self.open_captures = 0
+        self.wanted = threading.Event()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+    def acquire(self):
+        with self.lock:
+            self.open_captures += 1
+            self.wanted.set()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self.thread.start()
+
+    def release(self):
+        with self.lock:
+            self.open_captures -= 1
+            if self.open_captures == 0:
+                self.wanted.clear()
+
+    def _label(self, code) -> str:
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            self.wanted.wait()
+            now = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples.append((now, tuple(reversed(stack))))
+            time.sleep(self.interval)
+
+    def folded(self, started: float, finished: float) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for taken, stack in list(self.samples):
+            if started <= taken <= finished:
+                key = ";".join(stack)
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+
+class Profiler:
+    """Decides which requests to profile and keeps a bounded directory of captures"""
+
+    def __init__(self, enabled: bool = PROFILE_ENABLED, slow_ms: float = PROFILE_SLOW_MS,
+                 directory: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.directory = directory
+        self.max_files = max_files
+        self.sampler = StackSampler()
+        self.sequence = itertools.count()
+        self.captured = 0
+        self.discarded = 0
+
+    def configure(self, enabled: Optional[bool] = None, slow_ms: Optional[float] = None):
+        if enabled is not None:
+            self.enabled = enabled
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        logger.info(f"🔬 Profiling {'on' if self.enabled else 'off'}, slow request threshold {self.slow_ms:g}ms")
+
+    def wants(self, path: str, requested: bool) -> bool:
+        return self.enabled and path in PROFILED_PATHS and (requested or self.slow_ms > 0)
+
+    async def finish(self, path: str, trigger: str, started: float, status: int):
+        """Keep the samples of a finished request if it asked for it or was slow"""
+        finished = time.perf_counter()
+        duration_ms = (finished - started) * 1000
+        if trigger != "header":
+            if duration_ms < self.slow_ms:
+                self.discarded += 1
+                return None
+            trigger = "slow"
+        stacks = self.sampler.folded(started, finished)
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self.sequence)}"
+        meta = {
+            'id': profile_id,
+            'path': path,
+            'trigger': trigger,
+            'status': status,
+            'duration_ms': round(duration_ms, 1),
+            'samples': sum(stacks.values()),
+            'interval_ms': self.sampler.interval * 1000,
+            'captured_at': time.time(),
+        }
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, meta, stacks)
+        except OSError as e:
+            logger.warning(f"Could not save profile: {e}")
+            return None
+        self.captured += 1
+        PROFILES_CAPTURED.inc(trigger=trigger)
+        logger.info(f"🔬 Saved {trigger} profile {profile_id} ({duration_ms:.0f}ms, {meta['samples']} samples)")
+        return profile_id
+
+    def _write(self, meta: Dict, stacks: Dict[str, int]):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, meta['id'])
+        with open(f"{base}.folded", 'w', encoding='utf-8') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+        with open(f"{base}.json", 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        # Oldest profiles go first once the directory is over its limit
+        for stale in self.list_profiles()[self.max_files:]:
+            for suffix in (".folded", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, stale['id'] + suffix))
+                except OSError:
+                    pass
+
+    def list_profiles(self) -> List[Dict]:
+        """Metadata of the stored profiles, newest first"""
+        profiles = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sorted(profiles, key=lambda meta: meta.get('captured_at', 0), reverse=True)
+
+    def read_profile(self, profile_id: str) -> Optional[str]:
+        """Folded stacks of one profile, or None"""
+        if os.path.basename(profile_id) != profile_id:
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{profile_id}.folded"), 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'slow_ms': self.slow_ms,
+            'directory': self.directory,
+            'max_files': self.max_files,
+            'interval_ms': self.sampler.interval * 1000,
+            'captured': self.captured,
+            'discarded': self.discarded,
+            'sampling': self.sampler.open_captures > 0,
+        }
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that samples /ask requests for the Profiler.
+
+    Wraps the whole response, so a streamed answer is profiled until its last
+    event is sent. Disabled profiling costs one attribute check per request.
+    """
+
+    def __init__(self, app, profiler: "Profiler"):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if not self.profiler.enabled or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        requested = any(name == PROFILE_HEADER and value not in (b"", b"0") for name, value in scope["headers"])
+        path = scope["path"]
+        if not self.profiler.wants(path, requested):
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.profiler.sampler.acquire()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.profiler.sampler.release()
+            await self.profiler.finish(path, "header" if requested else "threshold", started, status)
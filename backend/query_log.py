@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # no advisory file locks (Windows): every worker replays generations
+    fcntl = None
+
+from answer_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+# Append-only JSONL record of the questions asked (empty disables it)
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "data/analytics/queries.jsonl")
+# Records written per batch, seconds between flushes, and records held while
+# the disk is slow before new ones are dropped
+QUERY_LOG_BATCH = int(os.getenv("QUERY_LOG_BATCH", "200"))
+QUERY_LOG_FLUSH_INTERVAL = float(os.getenv("QUERY_LOG_FLUSH_INTERVAL", "2"))
+QUERY_LOG_MAX_PENDING = int(os.getenv("QUERY_LOG_MAX_PENDING", "10000"))
+# The log is rotated to <path>.1 once it grows past this many megabytes
+QUERY_LOG_MAX_MB = float(os.getenv("QUERY_LOG_MAX_MB", "100"))
+
+
+class QueryLog:
+    """
+    Records every answered question without blocking the request.
+
+    `record` only appends to an in-memory list; a background task writes the
+    list to the JSONL file in batches from a thread. Each batch is one
+    O_APPEND write, so several uvicorn workers can share the file.
+    """
+
+    def __init__(self, path: str = QUERY_LOG_PATH, batch_size: int = QUERY_LOG_BATCH,
+                 flush_interval: float = QUERY_LOG_FLUSH_INTERVAL, max_pending: int = QUERY_LOG_MAX_PENDING,
+                 max_bytes: int = int(QUERY_LOG_MAX_MB * 1024 * 1024)):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.pending: List[Dict] = []
+        self.wake: Optional[asyncio.Event] = None
+        self.writer: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self.replay_lock: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def start(self):
+        """Start the background writer (call from a running event loop)"""
+        if self.enabled and self.writer is None:
+            self.wake = asyncio.Event()
+            self.writer = asyncio.create_task(self._write_forever())
+
+    async def close(self):
+        """Stop the writer and flush what is still pending"""
+        if self.writer is not None:
+            self.writer.cancel()
+            self.writer = None
+        await self.flush()
+
+    def record(self, question: str, route: str, outcome: str, seconds: float, cached: bool,
+               latency: Optional[str] = None, session: bool = False):
+        if not self.enabled:
+            return
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self.pending.append({
+            "ts": round(time.time(), 3),
+            "question": normalize_question(question),
+            "text": question.strip(),
+            "route": route,
+            "latency": latency,
+            "session": session,
+            "outcome": outcome,
+            "cached": cached,
+            "ms": round(seconds * 1000, 1),
+        })
+        if len(self.pending) >= self.batch_size and self.wake is not None:
+            self.wake.set()
+
+    async def _write_forever(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        while self.pending:
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._append, batch)
+                self.written += len(batch)
+            except OSError as e:
+                self.write_errors += 1
+                self.dropped += len(batch)
+                logger.warning(f"Could not write query log: {e}")
+                return
+
+    def _append(self, batch: List[Dict]):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            if os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, f"{self.path}.1")
+        except OSError:
+            pass
+        data = "".join(json.dumps(entry) + "\n" for entry in batch).encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            while data:
+                data = data[os.write(fd, data):]
+        finally:
+            os.close(fd)
+
+    def claim_replay(self) -> bool:
+        """
+        True in only one of the processes sharing this log: the first to ask
+        holds an flock on <path>.lock until it exits.
+        """
+        if fcntl is None or self.replay_lock is not None:
+            return True
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self.replay_lock = fd
+        return True
+
+    def top_questions(self, limit: int, window: float) -> List[Tuple[str, str, Optional[str], int]]:
+        """
+        The most frequent (question, route, latency) of the last `window`
+        seconds with their counts, most frequent first. Questions are counted
+        normalized but returned as most recently asked. Session turns are
+        skipped since their answers are never cached, and so are failed requests.
+        """
+        since = time.time() - window
+        counts: Dict[Tuple[str, str, Optional[str]], int] = {}
+        texts: Dict[str, str] = {}
+        for path in (f"{self.path}.1", self.path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        if entry.get("ts", 0) < since or entry.get("session") or entry.get("outcome") != "ok":
+                            continue
+                        key = (entry["question"], entry["route"], entry.get("latency"))
+                        counts[key] = counts.get(key, 0) + 1
+                        texts[entry["question"]] = entry.get("text") or entry["question"]
+            except OSError:
+                continue
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(texts[question], route, latency, count) for (question, route, latency), count in ranked]
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'path': self.path,
+            'pending': len(self.pending),
+            'written': self.written,
+            'dropped': self.dropped,
+            'write_errors': self.write_errors,
+        }
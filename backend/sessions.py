@@ -0,0 +1,121 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from metrics import SESSION_CONTEXT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Conversations kept in memory, idle seconds before one is forgotten, and the
+# longest Ollama context (in tokens) carried between turns
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+SESSION_MAX_CONTEXT = int(os.getenv("SESSION_MAX_CONTEXT", "8192"))
+
+
+class Session:
+    """One conversation: the context tokens Ollama returned for the last turn"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.context: List[int] = []
+        self.turns = 0
+        self.expires_at = 0.0
+
+
+class SessionStore:
+    """
+    Multi-turn conversations for /ask, held in an in-memory LRU with TTL.
+
+    Instead of re-sending the transcript, each turn passes back the `context`
+    array Ollama returned for the previous one, so only the new question has
+    to be prompt-evaluated. A context longer than max_context tokens starts
+    the conversation afresh. Turns of one session are expected to be
+    sequential; if two overlap, the one that finishes last is continued.
+    Each process holds its own store, so with several uvicorn workers a
+    conversation only continues on the worker that served its last turn.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_MAX, ttl: float = SESSION_TTL,
+                 max_context: int = SESSION_MAX_CONTEXT):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_context = max_context
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.created = 0
+        self.expired = 0
+        self.evictions = 0
+        self.resets = 0
+        self.turns = 0
+        self.context_tokens_reused = 0
+        self.prompt_eval_tokens = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_sessions > 0
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """The live session for session_id, starting a new one if needed"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        session = self.sessions.get(session_id)
+        if session is not None and session.expires_at <= now:
+            del self.sessions[session_id]
+            self.expired += 1
+            session = None
+        if session is None:
+            session = Session(session_id)
+            self.sessions[session_id] = session
+            self.created += 1
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evictions += 1
+        self.sessions.move_to_end(session_id)
+        session.expires_at = now + self.ttl
+        return session
+
+    def end(self, session_id: str) -> bool:
+        return self.sessions.pop(session_id, None) is not None
+
+    def payload_for(self, session: Session, payload: Dict) -> Dict:
+        """Add the session's context to an Ollama payload"""
+        if not session.context:
+            return payload
+        self.context_tokens_reused += len(session.context)
+        SESSION_CONTEXT_TOKENS.inc(len(session.context))
+        return {**payload, "context": session.context}
+
+    def record_turn(self, session: Session, final_chunk: Dict):
+        """Keep the context from a turn's final chunk for the next one"""
+        context = final_chunk.get("context") or []
+        session.turns += 1
+        self.turns += 1
+        self.prompt_eval_tokens += final_chunk.get("prompt_eval_count", 0)
+        if len(context) > self.max_context:
+            logger.info(f"Session context reached {len(context)} tokens, starting over")
+            self.resets += 1
+            context = []
+        session.context = context
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            # Sessions live in this worker only
+            'per_process': True,
+            'worker_pid': os.getpid(),
+            'sessions': len(self.sessions),
+            'max_sessions': self.max_sessions,
+            'ttl': self.ttl,
+            'max_context': self.max_context,
+            'created': self.created,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'resets': self.resets,
+            'turns': self.turns,
+            # Tokens not re-sent as transcript text, against what was actually evaluated
+            'context_tokens_reused': self.context_tokens_reused,
+            'prompt_eval_tokens': self.prompt_eval_tokens,
+        }
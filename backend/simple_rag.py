@@ -1,36 +1,175 @@
 import os
 import glob
+import hashlib
+import json
 import re
-from typing import List, Dict
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Dict, Optional
 import logging
+try:
+    import fcntl
+except ImportError:  # no advisory file locks (Windows): each worker builds its own snapshot
+    fcntl = None
+from book_index import BookIndex, PASSAGE_CODE, is_code_question
+from vector_index import OllamaEmbedder, VectorIndex, reciprocal_rank_fusion, semantic_available
+from metrics import STAGE_SECONDS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+CHAPTERS_DIR = "data/chapters"
+MANIFEST_NAME = "manifest.json"  # written by pdf_to_text's library ingestion
+DEFAULT_BOOK_ID = "default"
+SNAPSHOT_PATH = os.getenv("RAG_SNAPSHOT_PATH", "data/index/book_index.snap")
+
+# Worker pool used by aquery so retrieval never runs on the event loop.
+# "thread" shares the loaded index; "process" gives each worker its own
+# interpreter (and GIL), attaching to the memory-mapped snapshot on start.
+RAG_EXECUTOR = os.getenv("RAG_EXECUTOR", "thread")
+RAG_WORKERS = int(os.getenv("RAG_WORKERS", "2"))
+
+# "keyword" (BM25 only), "semantic" (passage embeddings) or "hybrid" (both,
+# fused by reciprocal rank). Semantic modes need numpy and a local Ollama
+# embedding model, and fall back to keyword search when either is missing.
+RAG_RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "keyword")
+SEMANTIC_CANDIDATES = 20  # chapters pulled from each ranking before fusion
+
+# Context packing for retrieval-augmented generation
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+CHARS_PER_TOKEN = 4  # rough estimate, good enough for budgeting
+CONTEXT_CHAPTERS = 4
+PASSAGES_PER_CHAPTER = 3
+MIN_CONTEXT_PASSAGE_TOKENS = 40  # don't bother packing a passage cut shorter than this
+
+# Seconds between polls of data/chapters for changed files (0 disables the watcher)
+RAG_WATCH_INTERVAL = float(os.getenv("RAG_WATCH_INTERVAL", "0"))
+
+@contextmanager
+def snapshot_lock():
+    """
+    Hold an exclusive lock on the snapshot while building or rewriting it.
+    
+    Uvicorn workers (and process pool workers) start together; the first one
+    builds the snapshot and the rest wait here, then memory-map its result.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(SNAPSHOT_PATH) or '.', exist_ok=True)
+    with open(f"{SNAPSHOT_PATH}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class CorpusGeneration:
+    """
+    One immutable version of the loaded corpus.
+    
+    Reloads build a new generation and swap it in with a single assignment;
+    a query reads `rag.generation` once, so it never mixes doc ids, passages
+    or vectors from two versions of the corpus.
+    """
+    
+    def __init__(self, index: BookIndex, sources: List[List], book_titles: Dict[str, str],
+                 vectors: Optional[VectorIndex] = None):
+        self.index = index
+        self.sources = sources
+        self.book_titles = book_titles
+        self.vectors = vectors
+        self.book_ids = sorted({chapter['book_id'] for chapter in index.chapters})
+        # Changes whenever any chapter file does; answer cache keys include it
+        self.version = hashlib.sha1(json.dumps(sources).encode('utf-8')).hexdigest()[:12]
+
 class SimpleBookRAG:
-    def __init__(self):
-        self.chapters = []
+    def __init__(self, executor_kind: str = RAG_EXECUTOR, max_workers: int = RAG_WORKERS):
+        self.generation: Optional[CorpusGeneration] = None
+        self.embedder: Optional[OllamaEmbedder] = None
+        self.reload_lock = threading.Lock()
+        self.retrieval_mode = RAG_RETRIEVAL_MODE
         self.is_initialized = False
+        self.executor_kind = executor_kind
+        self.max_workers = max_workers
+        self.executor: Optional[Executor] = None
+        self.pending = 0  # queries submitted to the pool and not yet finished
+    
+    @property
+    def index(self) -> Optional[BookIndex]:
+        return self.generation.index if self.generation else None
     
-    def load_chapters(self):
-        """Load all chapter files from the data/chapters directory"""
-        chapters_dir = "data/chapters"
+    @property
+    def chapters(self) -> List[Dict]:
+        return self.generation.index.chapters if self.generation else []
+    
+    @property
+    def vectors(self) -> Optional[VectorIndex]:
+        return self.generation.vectors if self.generation else None
+    
+    @property
+    def book_ids(self) -> List[str]:
+        return self.generation.book_ids if self.generation else []
+    
+    @property
+    def corpus_version(self) -> str:
+        return self.generation.version if self.generation else ""
+    
+    def chapter_files(self) -> List[str]:
+        """
+        Chapter files relative to data/chapters, sorted.
+        
+        Books ingested by pdf_to_text live in one subdirectory per book id;
+        loose top-level files belong to the default book.
+        """
+        if not os.path.exists(CHAPTERS_DIR):
+            return []
+        paths = glob.glob(os.path.join(CHAPTERS_DIR, "*.txt"))
+        paths += glob.glob(os.path.join(CHAPTERS_DIR, "*", "*.txt"))
+        return sorted(os.path.relpath(path, CHAPTERS_DIR).replace(os.sep, '/') for path in paths)
+    
+    def book_id_for(self, filename: str) -> str:
+        return filename.split('/', 1)[0] if '/' in filename else DEFAULT_BOOK_ID
+    
+    def load_book_titles(self) -> Dict[str, str]:
+        """Book titles from the ingestion manifest, if there is one"""
+        try:
+            with open(os.path.join(CHAPTERS_DIR, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+                books = json.load(f).get('books', {})
+            return {book_id: book.get('title', book_id) for book_id, book in books.items()}
+        except (OSError, ValueError):
+            return {}
+    
+    def book_label(self, book_id: str, generation: Optional[CorpusGeneration] = None) -> str:
+        if book_id == DEFAULT_BOOK_ID:
+            return "the Python Crash Course book"
+        book_titles = (generation or self.generation).book_titles
+        return f'"{book_titles.get(book_id, book_id)}"'
+    
+    def load_chapters(self, chapter_files: Optional[List[str]] = None):
+        """Load chapter files from the data/chapters directory (all of them by default)"""
+        chapters_dir = CHAPTERS_DIR
         if not os.path.exists(chapters_dir):
             logger.error(f"Chapters directory not found: {chapters_dir}")
             return []
         
-        chapter_files = glob.glob(os.path.join(chapters_dir, "*.txt"))
-        logger.info(f"Found {len(chapter_files)} chapter files")
+        if chapter_files is None:
+            chapter_files = self.chapter_files()
+            logger.info(f"Found {len(chapter_files)} chapter files")
         
         chapters = []
-        for file_path in sorted(chapter_files):
+        for filename in chapter_files:
+            file_path = os.path.join(chapters_dir, filename)
             try:
                 with open(file_path, 'r', encoding='utf-8') as f:
                     content = f.read()
-                    filename = os.path.basename(file_path)
                     chapters.append({
                         'filename': filename,
+                        'book_id': self.book_id_for(filename),
                         'content': content,
                         'title': self.extract_title(content)
                     })
@@ -48,16 +187,63 @@ class SimpleBookRAG:
                 return line.replace('Title:', '').strip()
         return "Unknown Chapter"
     
+    def scan_sources(self) -> List[List]:
+        """Fingerprint chapter files by path, size and mtime without reading them"""
+        sources = []
+        for filename in self.chapter_files():
+            stat = os.stat(os.path.join(CHAPTERS_DIR, filename))
+            sources.append([filename, stat.st_size, stat.st_mtime_ns])
+        return sources
+    
+    def build_index(self, sources: List[List]):
+        """Read chapter files, build the index and write a fresh snapshot"""
+        logger.info("Loading chapters...")
+        chapters = self.load_chapters()
+        if not chapters:
+            return None
+        
+        logger.info("Building search index...")
+        return self.save_index(BookIndex.build(chapters), sources)
+    
+    def save_index(self, index: BookIndex, sources: List[List]) -> BookIndex:
+        """Write the snapshot and switch to its memory-mapped copy, dropping the heap one"""
+        try:
+            index.save(SNAPSHOT_PATH, sources)
+            logger.info(f"💾 Saved index snapshot to {SNAPSHOT_PATH}")
+        except OSError as e:
+            logger.warning(f"Could not save index snapshot: {e}")
+            return index
+        return BookIndex.load(SNAPSHOT_PATH, sources) or index
+    
     def initialize(self):
         """Initialize the simple RAG system"""
         try:
-            logger.info("Loading chapters...")
-            self.chapters = self.load_chapters()
+            sources = self.scan_sources()
+            index = BookIndex.load(SNAPSHOT_PATH, sources) if sources else None
+            if index is None and sources:
+                # Another worker may be building it right now: wait, then map its result
+                with snapshot_lock():
+                    index = BookIndex.load(SNAPSHOT_PATH, sources)
+                    if index is None:
+                        index = self.build_index(sources)
+                    else:
+                        logger.info(f"Loaded index snapshot built by another worker from {SNAPSHOT_PATH}")
+            elif index is None:
+                index = self.build_index(sources)
+            else:
+                logger.info(f"Loaded index snapshot from {SNAPSHOT_PATH}")
             
-            if not self.chapters:
+            if index is None or not index.chapters:
                 logger.error("No chapters loaded")
                 return False
             
+            logger.info(f"Indexed {index.doc_count} chapters, {len(index.terms)} terms")
+            
+            vectors = None
+            if self.retrieval_mode != "keyword":
+                vectors = self.load_vectors(sources, index)
+            
+            self.generation = CorpusGeneration(index, sources, self.load_book_titles(), vectors)
             self.is_initialized = True
             logger.info("✅ Simple RAG system initialized successfully")
             return True
@@ -66,220 +252,401 @@ class SimpleBookRAG:
             logger.error(f"Error initializing RAG system: {e}")
             return False
     
-    def search_chapters(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Enhanced search that looks for code examples and better content"""
-        query_lower = query.lower()
-        query_words = [word for word in query_lower.split() if len(word) > 2]  # Filter short words
+    def load_vectors(self, sources: List[List], index: BookIndex) -> Optional[VectorIndex]:
+        """Load (or build) the passage embedding matrix for semantic retrieval"""
+        if not semantic_available():
+            logger.warning("numpy is not installed - using keyword retrieval only")
+            return None
         
-        results = []
-        for chapter in self.chapters:
-            content_lower = chapter['content'].lower()
-            score = 0
-            
-            # Give higher weight to title matches
-            title_lower = chapter['title'].lower()
-            for word in query_words:
-                if word in title_lower:
-                    score += 10  # High weight for title matches
-                if word in content_lower:
-                    score += content_lower.count(word)
-            
-            # Bonus for exact phrase matches
-            if query_lower in content_lower:
-                score += 50
+        try:
+            self.embedder = OllamaEmbedder()
+            vectors = VectorIndex.load(SNAPSHOT_PATH, sources, self.embedder.model, index)
+            if vectors is None:
+                with snapshot_lock():
+                    vectors = VectorIndex.load(SNAPSHOT_PATH, sources, self.embedder.model, index)
+                    if vectors is None:
+                        vectors = VectorIndex.build(SNAPSHOT_PATH, sources, self.embedder, index)
+            logger.info(f"✅ Semantic retrieval ready ({len(vectors.vectors)} passage vectors)")
+            return vectors
+        except Exception as e:
+            logger.warning(f"Semantic retrieval unavailable, using keyword search: {e}")
+            return None
+    
+    def reload(self) -> Dict:
+        """
+        Apply added, changed and removed chapter files to the live corpus.
+        
+        Only the affected files are read and tokenized (and embedded, in the
+        semantic modes); the rest is copied from the current generation. The
+        new generation replaces the old one atomically once it is complete.
+        """
+        with self.reload_lock:
+            if self.generation is None:
+                return {'reloaded': self.initialize(), 'added': [], 'removed': []}
             
-            # Bonus for code-related content
-            if any(code_word in content_lower for code_word in ['def ', 'class ', 'import ', 'print(', 'if ', 'for ', 'while ', 'return ']):
-                score += 20
+            old = self.generation
+            sources = self.scan_sources()
+            before = {filename: fingerprint for filename, *fingerprint in old.sources}
+            after = {filename: fingerprint for filename, *fingerprint in sources}
+            stale = {filename for filename, fingerprint in before.items() if after.get(filename) != fingerprint}
+            fresh = sorted(filename for filename, fingerprint in after.items() if before.get(filename) != fingerprint)
+            if not stale and not fresh:
+                return {'reloaded': False, 'added': [], 'removed': []}
             
-            # Bonus for specific programming terms
-            programming_terms = ['function', 'variable', 'loop', 'condition', 'string', 'list', 'dictionary', 'module']
-            for term in programming_terms:
-                if term in query_lower and term in content_lower:
-                    score += 15
+            logger.info(f"🔄 Reloading corpus: {len(fresh)} new or changed, "
+                        f"{len(stale - set(fresh))} removed chapter files")
+            with snapshot_lock():
+                # Workers sharing the snapshot all see the change; the first one applies it
+                index = BookIndex.load(SNAPSHOT_PATH, sources)
+                if index is not None:
+                    logger.info("Attached the snapshot another worker already reloaded")
+                    vectors = None
+                    if old.vectors is not None:
+                        vectors = VectorIndex.load(SNAPSHOT_PATH, sources, self.embedder.model, index)
+                else:
+                    chapters = self.load_chapters(fresh)
+                    kept = [doc_id for doc_id, chapter in enumerate(old.index.chapters)
+                            if chapter['filename'] not in stale]
+                    index = old.index.updated(stale, chapters)
+                    if not index.chapters:
+                        logger.error("Reload would leave no chapters - keeping the current corpus")
+                        return {'reloaded': False, 'added': [], 'removed': []}
+                    # Files that failed to read stay out of the fingerprint so the next reload retries them
+                    loaded = {chapter['filename'] for chapter in chapters}
+                    sources = [source for source in sources if source[0] not in fresh or source[0] in loaded]
+                    index = self.save_index(index, sources)
+                    
+                    vectors = None
+                    if old.vectors is not None:
+                        try:
+                            vectors = old.vectors.updated(SNAPSHOT_PATH, sources, self.embedder, old.index, kept, index)
+                        except Exception as e:
+                            logger.warning(f"Semantic retrieval unavailable after reload, using keyword search: {e}")
             
-            if score > 0:
-                results.append({
-                    'chapter': chapter,
-                    'score': score,
-                    'title': chapter['title']
-                })
-        
-        # Sort by score and return top results
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results[:top_k]
-    
-    def find_best_snippet(self, content: str, query: str, max_length: int = 1500) -> str:
-        """Find the most relevant snippet with complete code examples"""
-        query_lower = query.lower()
-        content_lower = content.lower()
-        
-        # Look for complete code blocks first
-        code_blocks = re.findall(r'```.*?```', content, re.DOTALL)
-        if not code_blocks:
-            # Look for function definitions with their full body
-            code_blocks = re.findall(r'def\s+\w+\([^)]*\):.*?(?=\n\S|\Z)', content, re.DOTALL)
-        if not code_blocks:
-            # Look for class definitions
-            code_blocks = re.findall(r'class\s+\w+.*?def', content, re.DOTALL)
-        
-        # If we found code blocks, include them with context
-        if code_blocks:
-            best_code = code_blocks[0]
-            # Find the paragraph before the code
-            lines = content.split('\n')
-            code_start = content.find(best_code)
-            if code_start > 0:
-                # Get more context before the code
-                before_code = content[:code_start].strip()
-                if before_code:
-                    # Take the last few paragraphs before the code
-                    paragraphs = before_code.split('\n\n')
-                    if paragraphs:
-                        # Get the last 2-3 paragraphs for better context
-                        context_paragraphs = paragraphs[-3:] if len(paragraphs) >= 3 else paragraphs
-                        context = '\n\n'.join(context_paragraphs).strip()
-                        result = f"{context}\n\n💻 Complete Code Example:\n{best_code}"
-                        if len(result) > max_length:
-                            result = result[:max_length] + "..."
-                        return result
-        
-        # Look for specific code patterns in the content
-        code_patterns = [
-            r'def\s+\w+\([^)]*\):.*?(?=\n\S|\Z)',  # Function definitions
-            r'class\s+\w+.*?def',  # Class definitions
-            r'for\s+\w+\s+in\s+.*?:.*?(?=\n\S|\Z)',  # For loops
-            r'if\s+.*?:.*?(?=\n\S|\Z)',  # If statements
-            r'while\s+.*?:.*?(?=\n\S|\Z)',  # While loops
-        ]
-        
-        for pattern in code_patterns:
-            matches = re.findall(pattern, content, re.DOTALL)
-            if matches:
-                best_match = matches[0]
-                # Find context before this code
-                code_start = content.find(best_match)
-                if code_start > 0:
-                    before_code = content[:code_start].strip()
-                    if before_code:
-                        paragraphs = before_code.split('\n\n')
-                        if paragraphs:
-                            context = paragraphs[-1].strip()
-                            result = f"{context}\n\n💻 Code Example:\n{best_match}"
-                            if len(result) > max_length:
-                                result = result[:max_length] + "..."
-                            return result
-        
-        # Try to find a paragraph that contains the query and code
-        paragraphs = content.split('\n\n')
-        best_paragraph = ""
-        best_score = 0
+            self.generation = CorpusGeneration(index, sources, self.load_book_titles(), vectors)
+            if self.executor_kind == "process" and self.executor is not None:
+                # Process workers hold their own copy: let the running queries
+                # finish on the old pool and start fresh workers from the new snapshot
+                self.executor.shutdown(wait=False)
+                self.executor = None
+            logger.info(f"✅ Corpus reloaded: {index.doc_count} chapters, {len(index.terms)} terms")
+            return {'reloaded': True, 'added': fresh, 'removed': sorted(stale - set(fresh))}
+    
+    def search_chapters(self, query: str, top_k: int = 3,
+                        generation: Optional[CorpusGeneration] = None) -> List[Dict]:
+        """Rank chapters with BM25, passage embeddings, or both (see RAG_RETRIEVAL_MODE)"""
+        generation = generation or self.generation
+        if generation is None:
+            return []
+        index = generation.index
         
-        for paragraph in paragraphs:
-            if len(paragraph.strip()) < 50:  # Skip very short paragraphs
-                continue
-                
-            score = 0
-            for word in query_lower.split():
-                if word in paragraph.lower():
-                    score += paragraph.lower().count(word)
-            
-            # High bonus for code in paragraph
-            if any(code_indicator in paragraph for code_indicator in ['def ', 'class ', 'import ', 'print(', 'if ', 'for ', 'while ']):
-                score += 20
-            
-            if score > best_score:
-                best_score = score
-                best_paragraph = paragraph
+        semantic = []
+        if generation.vectors is not None:
+            try:
+                query_vector = self.embedder.embed([query])[0]
+                semantic = generation.vectors.search_chapters(query_vector, max(top_k, SEMANTIC_CANDIDATES))
+            except Exception as e:
+                logger.warning(f"Query embedding failed, using keyword search: {e}")
         
-        if best_paragraph:
-            # Clean up the paragraph
-            cleaned = re.sub(r'\s+', ' ', best_paragraph.strip())
-            if len(cleaned) > max_length:
-                cleaned = cleaned[:max_length] + "..."
-            return cleaned
+        if not semantic:
+            ranked = [(doc_id, score, None) for doc_id, score in index.search(query, top_k)]
+        elif self.retrieval_mode == "semantic":
+            ranked = semantic[:top_k]
+        else:
+            keyword = index.search(query, max(top_k, SEMANTIC_CANDIDATES))
+            fused = reciprocal_rank_fusion(
+                [doc_id for doc_id, _ in keyword],
+                [doc_id for doc_id, _, _ in semantic]
+            )
+            ranked = [(doc_id, score, None) for doc_id, score in
+                      sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]]
         
-        # Fallback: return first meaningful content with code
-        lines = content.split('\n')
-        meaningful_lines = []
-        code_found = False
+        results = []
+        for doc_id, score, passage_id in ranked:
+            chapter = index.chapters[doc_id]
+            results.append({
+                'doc_id': doc_id,
+                'chapter': chapter,
+                'book_id': chapter['book_id'],
+                'score': score,
+                'title': chapter['title'],
+                'passage_id': passage_id
+            })
+        return results
+    
+    def find_best_snippet(self, doc_id: int, query: str, max_length: int = 1500,
+                          passage_id: Optional[int] = None,
+                          generation: Optional[CorpusGeneration] = None) -> str:
+        """Return the best precomputed passage of a chapter for the query"""
+        index = (generation or self.generation).index
+        if passage_id is None:
+            passages = index.best_passages(doc_id, query)
+            if not passages:
+                return ""
+            passage_id = passages[0]
         
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith('===') and not line.startswith('Title:'):
-                meaningful_lines.append(line)
-                
-                # Check if we found code
-                if any(code_indicator in line for code_indicator in ['def ', 'class ', 'import ', 'print(', 'if ', 'for ', 'while ']):
-                    code_found = True
-                
-                if len('\n'.join(meaningful_lines)) > max_length:
-                    break
+        if index.passage_kinds[passage_id] == PASSAGE_CODE:
+            code = index.passage_text(passage_id)
+            context = index.passage_text(passage_id, with_context=True)[:-len(code)].strip()
+            result = f"{context}\n\n💻 Code Example:\n{code}" if context else code
+        else:
+            result = re.sub(r'\s+', ' ', index.passage_text(passage_id))
         
-        result = '\n'.join(meaningful_lines)
         if len(result) > max_length:
             result = result[:max_length] + "..."
-        
-        if code_found:
-            result += "\n\n💻 This chapter contains code examples!"
-        
         return result
     
-    def query(self, question: str) -> str:
-        """Query the simple RAG system with detailed responses"""
+    def answer(self, question: str) -> Dict:
+        """
+        Query the simple RAG system with detailed responses.
+        
+        Returns {'answer': text, 'sources': [chapter titles], 'book_ids': [...],
+        'timings': {stage: seconds}}. Errors are raised, so callers can fall
+        back instead of showing (or caching) them as the answer.
+        """
         if not self.is_initialized:
-            return "RAG system not initialized. Please try again."
+            return {'answer': "RAG system not initialized. Please try again.", 'sources': [], 'book_ids': []}
         
         try:
             logger.info(f"Processing question: {question[:50]}...")
+            generation = self.generation
             
             # Search for relevant chapters
-            results = self.search_chapters(question, top_k=5)  # Get more results
+            started = time.perf_counter()
+            results = self.search_chapters(question, top_k=5, generation=generation)  # Get more results
+            timings = {'chapter_search': time.perf_counter() - started}
             
             if not results:
-                return "I couldn't find relevant information about that in the Python Crash Course book."
+                library = self.book_label(DEFAULT_BOOK_ID) if generation.book_ids == [DEFAULT_BOOK_ID] else "the book library"
+                return {
+                    'answer': f"I couldn't find relevant information about that in {library}.",
+                    'sources': [],
+                    'book_ids': [],
+                    'timings': timings
+                }
             
             # Create a detailed response
-            response = f"Based on the Python Crash Course book, here's what I found:\n\n"
+            best_match = results[0]
+            book = self.book_label(best_match['book_id'], generation)
+            response = f"Based on {book}, here's what I found:\n\n"
             response += f"📖 Main Chapter: {results[0]['title']}\n\n"
             
             # Get the best snippet from the main chapter
-            best_match = results[0]
-            chapter_content = best_match['chapter']['content']
-            snippet = self.find_best_snippet(chapter_content, question)
+            started = time.perf_counter()
+            snippet = self.find_best_snippet(best_match['doc_id'], question, passage_id=best_match['passage_id'],
+                                             generation=generation)
             
             # Check if this is a code-related question
-            code_keywords = ['function', 'def', 'class', 'code', 'example', 'syntax', 'program', 'method', 'loop', 'variable']
-            is_code_question = any(keyword in question.lower() for keyword in code_keywords)
+            code_question = is_code_question(question)
             
-            if is_code_question:
+            if code_question:
                 response += f"💻 Complete Code Example:\n{snippet}\n\n"
             else:
                 response += f"📝 Detailed Explanation:\n{snippet}\n\n"
             
-            response += f"💡 This information comes from the Python Crash Course book by Eric Matthes.\n\n"
+            if best_match['book_id'] == DEFAULT_BOOK_ID:
+                response += f"💡 This information comes from the Python Crash Course book by Eric Matthes.\n\n"
+            else:
+                response += f"💡 This information comes from {book}.\n\n"
             
             # Add additional examples from other chapters
+            shown = results[:4]
             if len(results) > 1:
                 response += f"🔍 Additional Examples from Other Chapters:\n"
                 for i, result in enumerate(results[1:4], 2):  # Show up to 3 more
                     response += f"\n📖 Chapter {i}: {result['title']}\n"
                     # Get a shorter snippet from additional chapters
-                    additional_snippet = self.find_best_snippet(result['chapter']['content'], question, max_length=300)
+                    additional_snippet = self.find_best_snippet(
+                        result['doc_id'], question, max_length=300, passage_id=result['passage_id'],
+                        generation=generation
+                    )
                     response += f"📝 {additional_snippet[:200]}...\n"
+            timings['snippet_extraction'] = time.perf_counter() - started
             
             # Add usage tips for code questions
-            if is_code_question:
+            if code_question:
                 response += f"\n💡 Usage Tips:\n"
                 response += f"• Copy the code examples and run them in your Python environment\n"
                 response += f"• Experiment with the code by modifying parameters\n"
                 response += f"• Check the book for more detailed explanations\n"
             
-            return response
+            book_ids = []
+            for result in shown:
+                if result['book_id'] not in book_ids:
+                    book_ids.append(result['book_id'])
+            return {'answer': response, 'sources': [result['title'] for result in shown], 'book_ids': book_ids,
+                    'timings': timings}
                 
         except Exception as e:
             logger.error(f"Error processing query: {e}")
-            return f"Error processing your question: {str(e)}"
+            raise
+    
+    def query(self, question: str) -> str:
+        """Query the simple RAG system and return only the answer text"""
+        return self.answer(question)['answer']
+    
+    def retrieve_context(self, question: str, token_budget: int = RAG_CONTEXT_TOKENS) -> Dict:
+        """
+        Pick the best passages for prompting an LLM within token_budget.
+        
+        Passages are taken round-robin across the top chapters (best passage of
+        each chapter first), skipping duplicates and overlapping spans; the last
+        one is truncated to fit. Returns {'passages': [{'title', 'book', 'text'}],
+        'sources': [chapter titles], 'book_ids': [...], 'timings': {stage: seconds}}.
+        """
+        context = {'passages': [], 'sources': [], 'book_ids': [], 'timings': {}}
+        if not self.is_initialized:
+            return context
+        
+        generation = self.generation
+        index = generation.index
+        started = time.perf_counter()
+        results = self.search_chapters(question, top_k=CONTEXT_CHAPTERS, generation=generation)
+        context['timings']['chapter_search'] = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        candidates = []
+        for result in results:
+            passage_ids = index.best_passages(result['doc_id'], question, limit=PASSAGES_PER_CHAPTER)
+            if result['passage_id'] is not None and result['passage_id'] not in passage_ids:
+                passage_ids = [result['passage_id']] + passage_ids[:PASSAGES_PER_CHAPTER - 1]
+            candidates.append((result['title'], result['book_id'], passage_ids))
+        
+        budget = token_budget * CHARS_PER_TOKEN
+        spans = []  # byte spans already packed
+        fingerprints = set()
+        for rank in range(PASSAGES_PER_CHAPTER):
+            for title, book_id, passage_ids in candidates:
+                if rank >= len(passage_ids) or budget < MIN_CONTEXT_PASSAGE_TOKENS * CHARS_PER_TOKEN:
+                    continue
+                passage_id = passage_ids[rank]
+                start = index.passage_starts[passage_id]
+                end = index.passage_ends[passage_id]
+                if any(start < packed_end and packed_start < end for packed_start, packed_end in spans):
+                    continue
+                # Only include a code passage's lead-in text if it isn't packed already
+                context_start = index.passage_context_starts[passage_id]
+                with_context = not any(context_start < packed_end and packed_start < start
+                                       for packed_start, packed_end in spans)
+                text = index.passage_text(passage_id, with_context=with_context).strip()
+                
+                fingerprint = re.sub(r'\s+', ' ', text.lower())
+                if fingerprint in fingerprints:
+                    continue
+                if len(text) > budget:
+                    text = text[:budget] + "..."
+                
+                fingerprints.add(fingerprint)
+                spans.append((context_start if with_context else start, end))
+                budget -= len(text)
+                context['passages'].append({'title': title, 'book': self.book_label(book_id, generation),
+                                            'text': text})
+                if title not in context['sources']:
+                    context['sources'].append(title)
+                if book_id not in context['book_ids']:
+                    context['book_ids'].append(book_id)
+        
+        context['timings']['context_packing'] = time.perf_counter() - started
+        return context
+    
+    def answer_many(self, questions: List[str]) -> List[Optional[Dict]]:
+        """answer() for several questions in one call (one pool round-trip); None where answering failed"""
+        answers = []
+        for question in questions:
+            try:
+                answers.append(self.answer(question))
+            except Exception:
+                answers.append(None)
+        return answers
+    
+    def retrieve_context_many(self, questions: List[str], token_budget: int = RAG_CONTEXT_TOKENS) -> List[Optional[Dict]]:
+        """retrieve_context() for several questions; None where retrieval failed"""
+        contexts = []
+        for question in questions:
+            try:
+                contexts.append(self.retrieve_context(question, token_budget))
+            except Exception as e:
+                logger.error(f"Error retrieving context: {e}")
+                contexts.append(None)
+        return contexts
+    
+    def get_executor(self) -> Executor:
+        if self.executor is None:
+            if self.executor_kind == "process":
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=initialize_simple_rag
+                )
+            else:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="rag"
+                )
+        return self.executor
+    
+    async def run_in_pool(self, method: str, *args):
+        """Run one of this instance's methods on the worker pool"""
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor()
+        if self.executor_kind == "process":
+            # Process workers hold their own module-level instance
+            call = loop.run_in_executor(executor, call_simple_rag, method, *args)
+        else:
+            call = loop.run_in_executor(executor, getattr(self, method), *args)
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            result = await call
+        finally:
+            self.pending -= 1
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="rag_pool")
+        # Workers (possibly other processes) report stage timings in their results
+        for item in (result if isinstance(result, list) else [result]):
+            if isinstance(item, dict):
+                for stage, seconds in item.pop('timings', {}).items():
+                    STAGE_SECONDS.observe(seconds, stage=stage)
+        return result
+    
+    async def aquery(self, question: str) -> str:
+        """Run query() on the worker pool without blocking the event loop"""
+        return await self.run_in_pool("query", question)
+    
+    async def aanswer(self, question: str) -> Dict:
+        """Run answer() on the worker pool without blocking the event loop"""
+        return await self.run_in_pool("answer", question)
+    
+    async def aretrieve_context(self, question: str, token_budget: int = RAG_CONTEXT_TOKENS) -> Dict:
+        """Run retrieve_context() on the worker pool"""
+        return await self.run_in_pool("retrieve_context", question, token_budget)
+    
+    async def arun_many(self, method: str, questions: List[str], *args) -> List:
+        """Run a *_many method over questions split into one chunk per worker"""
+        if not questions:
+            return []
+        size = -(-len(questions) // self.max_workers)
+        chunks = [questions[start:start + size] for start in range(0, len(questions), size)]
+        results = await asyncio.gather(*(self.run_in_pool(method, chunk, *args) for chunk in chunks))
+        return [item for chunk in results for item in chunk]
+    
+    async def aanswer_many(self, questions: List[str]) -> List[Optional[Dict]]:
+        return await self.arun_many("answer_many", questions)
+    
+    async def aretrieve_context_many(self, questions: List[str], token_budget: int = RAG_CONTEXT_TOKENS) -> List[Optional[Dict]]:
+        return await self.arun_many("retrieve_context_many", questions, token_budget)
+    
+    def pool_stats(self) -> Dict:
+        """Worker pool size, in-flight queries and how many are waiting"""
+        return {
+            'executor': self.executor_kind,
+            'workers': self.max_workers,
+            'pending': self.pending,
+            'queue_depth': max(0, self.pending - self.max_workers),
+        }
+    
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
 
 # Global RAG instance
 simple_rag_system = SimpleBookRAG()
@@ -292,6 +659,34 @@ def query_simple_rag(question: str) -> str:
     """Query the simple RAG system"""
     return simple_rag_system.query(question)
 
+def reload_simple_rag() -> Dict:
+    """Apply chapter file changes to the live RAG system"""
+    return simple_rag_system.reload()
+
+def call_simple_rag(method: str, *args):
+    """Entry point for process pool workers"""
+    return getattr(simple_rag_system, method)(*args)
+
+async def aquery_simple_rag(question: str) -> str:
+    """Query the simple RAG system on its worker pool"""
+    return await simple_rag_system.aquery(question)
+
+async def aanswer_simple_rag(question: str) -> Dict:
+    """Answer with sources and book ids on the worker pool"""
+    return await simple_rag_system.aanswer(question)
+
+async def aretrieve_context_simple_rag(question: str) -> Dict:
+    """Retrieve prompt context passages on the worker pool"""
+    return await simple_rag_system.aretrieve_context(question)
+
+async def aanswer_many_simple_rag(questions: List[str]) -> List[Optional[Dict]]:
+    """Answer a batch of questions across the worker pool"""
+    return await simple_rag_system.aanswer_many(questions)
+
+async def aretrieve_context_many_simple_rag(questions: List[str]) -> List[Optional[Dict]]:
+    """Retrieve prompt context for a batch of questions across the worker pool"""
+    return await simple_rag_system.aretrieve_context_many(questions)
+
 # Test function
 def test_simple_rag():
     """Test the simple RAG system"""
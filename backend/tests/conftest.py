@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The backend modules are imported by name, as uvicorn runs them from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep test requests out of the query log
+os.environ["QUERY_LOG_PATH"] = ""
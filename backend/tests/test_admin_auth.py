@@ -0,0 +1,19 @@
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_admin_endpoints_refuse_remote_clients_without_a_token(monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "")
+    client = TestClient(main.app)  # requests come from host "testclient"
+    assert client.get("/admin/profiling").status_code == 403
+    assert client.post("/admin/profiling", json={"enabled": True}).status_code == 403
+    assert main.profiler.enabled is False
+
+
+def test_admin_endpoints_require_the_token(monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+    client = TestClient(main.app)
+    assert client.get("/admin/profiles").status_code == 401
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": "wrong"}).status_code == 401
+    assert client.get("/admin/profiling", headers={"X-Admin-Token": "s3cret"}).status_code == 200
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from admission import PRIORITY_BATCH, PRIORITY_INTERACTIVE, AdmissionController, AdmissionError
+
+
+def run(scenario):
+    return asyncio.run(asyncio.wait_for(scenario(), 5))
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_freed_slot_goes_to_interactive_before_earlier_batch_waiters():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=5)
+        holder = await admission.acquire()
+        order = []
+
+        async def waiter(name, priority):
+            admitted_at = await admission.acquire(priority)
+            order.append(name)
+            admission.release(admitted_at)
+
+        tasks = []
+        for name, priority in (("batch-1", PRIORITY_BATCH), ("batch-2", PRIORITY_BATCH),
+                               ("interactive", PRIORITY_INTERACTIVE)):
+            tasks.append(asyncio.create_task(waiter(name, priority)))
+            await settle()
+        assert admission.queued == 3
+
+        admission.release(holder)
+        await asyncio.gather(*tasks)
+        assert order == ["interactive", "batch-1", "batch-2"]
+        assert admission.active == 0
+
+    run(scenario)
+
+
+def test_full_queue_rejects_with_429_and_retry_after():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+        holder = await admission.acquire()
+        queued = asyncio.create_task(admission.acquire())
+        await settle()
+
+        with pytest.raises(AdmissionError) as rejected:
+            await admission.acquire()
+        assert rejected.value.status_code == 429
+        assert rejected.value.retry_after >= 1
+        assert admission.rejected == 1
+
+        admission.release(holder)
+        admission.release(await queued)
+        assert admission.active == 0
+
+    run(scenario)
+
+
+def test_waiting_past_the_queue_timeout_gives_503():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=0.05)
+        holder = await admission.acquire()
+
+        with pytest.raises(AdmissionError) as timed_out:
+            await admission.acquire()
+        assert timed_out.value.status_code == 503
+        assert admission.timed_out == 1
+        assert admission.queued == 0
+
+        # The slot is not handed to the waiter that gave up
+        admission.release(holder)
+        assert admission.active == 0
+
+    run(scenario)
+
+
+def test_cancelled_waiter_is_skipped_when_a_slot_frees():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=5)
+        holder = await admission.acquire()
+        gone = asyncio.create_task(admission.acquire())
+        await settle()
+        next_in_line = asyncio.create_task(admission.acquire())
+        await settle()
+
+        gone.cancel()
+        await settle()
+        admission.release(holder)
+        admission.release(await next_in_line)
+        assert gone.cancelled()
+        assert admission.active == 0
+
+    run(scenario)
+
+
+def test_slot_handed_to_a_waiter_cancelled_before_it_resumed_is_passed_on():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=5)
+        holder = await admission.acquire()
+        gone = asyncio.create_task(admission.acquire())
+        await settle()
+        next_in_line = asyncio.create_task(admission.acquire())
+        await settle()
+
+        # The slot changes hands, but the waiter is cancelled before it runs again
+        admission.release(holder)
+        gone.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await gone
+        admission.release(await next_in_line)
+        assert admission.active == 0
+
+    run(scenario)
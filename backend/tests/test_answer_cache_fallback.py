@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from answer_cache import AnswerCache
+
+
+class StubOllama:
+    """Answers every generation with a fixed text"""
+
+    def __init__(self):
+        self.generations = 0
+
+    async def generate(self, payload, priority):
+        self.generations += 1
+        return {"response": "an Ollama answer", "done": True}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "answer_cache", AnswerCache(max_size=100, ttl=3600, db_path=""))
+    monkeypatch.setattr(main, "ollama", StubOllama())
+    monkeypatch.setattr(main.simple_rag_system, "is_initialized", True)
+    monkeypatch.setattr(main, "batch_slots", asyncio.Semaphore(4))
+    return TestClient(main.app)
+
+
+def test_failed_book_lookup_is_not_cached_as_the_book_answer(client, monkeypatch):
+    lookups = {"count": 0}
+
+    async def flaky_lookup(question):
+        lookups["count"] += 1
+        if lookups["count"] == 1:
+            raise RuntimeError("index unavailable")
+        return {"answer": "a book answer", "sources": ["Lists"], "book_ids": ["default"]}
+
+    monkeypatch.setattr(main, "aanswer_simple_rag", flaky_lookup)
+    body = {"question": "What is a list?", "use_rag": True}
+
+    degraded = client.post("/ask", json=body).json()
+    assert degraded["source"] == "ollama"
+
+    recovered = client.post("/ask", json=body).json()
+    assert recovered["source"] == "book_rag"
+    assert recovered["cached"] is False
+    assert lookups["count"] == 2
+
+
+def test_failed_batch_lookup_is_not_cached_as_the_book_answer(client, monkeypatch):
+    lookups = {"count": 0}
+
+    async def flaky_lookups(questions):
+        lookups["count"] += 1
+        if lookups["count"] == 1:
+            raise RuntimeError("index unavailable")
+        return [{"answer": "a book answer", "sources": ["Lists"], "book_ids": ["default"]} for _ in questions]
+
+    monkeypatch.setattr(main, "aanswer_many_simple_rag", flaky_lookups)
+    body = {"questions": [{"question": "What is a list?", "use_rag": True}]}
+
+    degraded = client.post("/ask/batch", json=body).json()["results"][0]["response"]
+    assert degraded["source"] == "ollama"
+
+    recovered = client.post("/ask/batch", json=body).json()["results"][0]["response"]
+    assert recovered["source"] == "book_rag"
+    assert recovered["cached"] is False
+
+
+def test_failed_retrieval_is_not_cached_as_the_augmented_answer(client, monkeypatch):
+    retrievals = {"count": 0}
+
+    async def flaky_retrieval(question):
+        retrievals["count"] += 1
+        if retrievals["count"] == 1:
+            raise RuntimeError("index unavailable")
+        return {"passages": [{"title": "Lists", "text": "A list holds items."}],
+                "sources": ["Lists"], "book_ids": ["default"]}
+
+    monkeypatch.setattr(main, "aretrieve_context_simple_rag", flaky_retrieval)
+    body = {"question": "What is a list?", "use_rag": True, "augment": True}
+
+    degraded = client.post("/ask", json=body).json()
+    assert degraded["source"] == "ollama"
+
+    recovered = client.post("/ask", json=body).json()
+    assert recovered["source"] == "rag_llm"
+    assert recovered["cached"] is False
+
+
+def test_book_answer_that_fails_inside_the_rag_system_is_not_cached(client, monkeypatch):
+    def broken_search(question, top_k=5, generation=None):
+        raise RuntimeError("index unavailable")
+
+    monkeypatch.setattr(main.simple_rag_system, "search_chapters", broken_search)
+    monkeypatch.setattr(main.simple_rag_system, "executor_kind", "thread")
+    monkeypatch.setattr(main.simple_rag_system, "executor", None)
+    single = {"question": "What is a list?", "use_rag": True}
+    batch = {"questions": [{"question": "What is a tuple?", "use_rag": True}]}
+
+    try:
+        answered = client.post("/ask", json=single).json()
+        batched = client.post("/ask/batch", json=batch).json()["results"][0]["response"]
+    finally:
+        main.simple_rag_system.shutdown()
+
+    assert answered["source"] == "ollama"
+    assert batched["source"] == "ollama"
+    cached = [value["source"] for value, _ in main.answer_cache.entries.values()]
+    assert cached == ["ollama", "ollama"]
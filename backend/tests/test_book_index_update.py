@@ -0,0 +1,75 @@
+import pytest
+
+from book_index import BookIndex
+
+
+def chapter(filename, title, content, book_id="default"):
+    return {'filename': filename, 'book_id': book_id, 'title': title, 'content': content}
+
+
+LISTS = chapter("chapter_03_Lists.txt", "Introducing Lists", (
+    "A list is a collection of items in a particular order. You can sort a list "
+    "permanently with the sort() method.\n\n"
+    "cars = ['bmw', 'audi', 'toyota']\ncars.sort()\nprint(cars)\n\n"
+    "Use sorted() to keep the original order of the list."
+))
+LOOPS = chapter("chapter_04_Working_with_Lists.txt", "Working with Lists", (
+    "A for loop repeats an action for every item in a list.\n\n"
+    "magicians = ['alice', 'david']\nfor magician in magicians:\n    print(magician)\n\n"
+    "Indentation errors are common when the loop body is not indented."
+))
+DICTIONARIES = chapter("chapter_06_Dictionaries.txt", "Dictionaries", (
+    "A dictionary is a collection of key-value pairs. Each key is connected to a value.\n\n"
+    "alien = {'color': 'green', 'points': 5}\nprint(alien['color'])\n\n"
+    "Loop through a dictionary with items() to get keys and values together."
+))
+LOOPS_REVISED = chapter("chapter_04_Working_with_Lists.txt", "Working with Lists", (
+    "Slicing a list returns part of it, and a tuple is a list that cannot change.\n\n"
+    "dimensions = (200, 50)\nfor dimension in dimensions:\n    print(dimension)\n\n"
+    "A for loop over a slice only visits the items in the slice."
+))
+FILES = chapter("chapter_10_Files.txt", "Files and Exceptions", (
+    "Read a whole file with read() and handle a missing file with a try-except block.\n\n"
+    "try:\n    with open('pi.txt') as f:\n        contents = f.read()\nexcept FileNotFoundError:\n    pass"
+), book_id="crash_course_3e")
+
+QUERIES = [
+    "how do I sort a list",
+    "for loop over a list",
+    "tuple slice",
+    "dictionary key value",
+    "missing file exception",
+    "magician",  # only in the modified chapter's old version
+    "print",
+]
+
+
+def test_updated_index_matches_a_fresh_build():
+    index = BookIndex.build([LISTS, LOOPS, DICTIONARIES])
+    # Modify one chapter, delete another and add a new one, in two reloads
+    index = index.updated({LOOPS['filename']}, [LOOPS_REVISED])
+    index = index.updated({DICTIONARIES['filename']}, [FILES])
+
+    final = {chapter['filename']: chapter for chapter in [LISTS, LOOPS_REVISED, FILES]}
+    assert sorted(final) == sorted(entry['filename'] for entry in index.chapters)
+    # Same documents in the same order, so doc and passage ids line up
+    fresh = BookIndex.build([final[entry['filename']] for entry in index.chapters])
+
+    assert index.chapters == fresh.chapters
+    assert index.avg_doc_length == pytest.approx(fresh.avg_doc_length)
+    assert index.avg_passage_length == pytest.approx(fresh.avg_passage_length)
+    for doc_id in range(fresh.doc_count):
+        assert index.content(doc_id) == fresh.content(doc_id)
+
+    for query in QUERIES:
+        results = index.search(query, top_k=5)
+        expected = fresh.search(query, top_k=5)
+        assert [doc_id for doc_id, _ in results] == [doc_id for doc_id, _ in expected], query
+        assert [score for _, score in results] == pytest.approx([score for _, score in expected]), query
+        for doc_id in range(fresh.doc_count):
+            passages = index.best_passages(doc_id, query, limit=3)
+            assert passages == fresh.best_passages(doc_id, query, limit=3), (query, doc_id)
+            assert [index.passage_text(p, with_context=True) for p in passages] == \
+                [fresh.passage_text(p, with_context=True) for p in passages]
+
+    assert not index.search("magician")
@@ -0,0 +1,59 @@
+import asyncio
+
+from ollama_client import GenerationBroadcast
+
+
+async def start_generation():
+    broadcast = GenerationBroadcast()
+    broadcast.task = asyncio.create_task(asyncio.sleep(60))
+    return broadcast
+
+
+def test_subscriber_counts_before_it_reads_its_first_chunk():
+    async def scenario():
+        broadcast = await start_generation()
+        early = broadcast.subscribe()
+        late = broadcast.subscribe()
+        assert broadcast.subscribers == 2
+
+        broadcast.publish({"response": "Python", "done": False})
+        assert (await early.__anext__())["response"] == "Python"
+        await early.aclose()
+        await asyncio.sleep(0)
+        # `late` has not read anything yet but still holds the generation
+        assert broadcast.subscribers == 1
+        assert not broadcast.task.cancelled()
+
+        broadcast.publish({"response": "", "done": True})
+        broadcast.finish()
+        assert [chunk["response"] async for chunk in late] == ["Python", ""]
+        assert broadcast.subscribers == 0
+        broadcast.task.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_generation_is_cancelled_when_every_subscriber_is_closed_unread():
+    async def scenario():
+        broadcast = await start_generation()
+        streams = [broadcast.subscribe(), broadcast.subscribe()]
+        for stream in streams:
+            await stream.aclose()
+            await stream.aclose()  # closing twice releases once
+        await asyncio.sleep(0)
+        assert broadcast.subscribers == 0
+        assert broadcast.task.cancelled()
+
+    asyncio.run(scenario())
+
+
+def test_dropped_subscription_is_released():
+    async def scenario():
+        broadcast = await start_generation()
+        stream = broadcast.subscribe()
+        del stream
+        await asyncio.sleep(0)
+        assert broadcast.subscribers == 0
+        assert broadcast.task.cancelled()
+
+    asyncio.run(scenario())
@@ -0,0 +1,33 @@
+import json
+
+from fastapi.testclient import TestClient
+
+import main
+from answer_cache import AnswerCache
+from ollama_client import OllamaError
+
+
+class BrokenStreamOllama:
+    """Streams one token, then fails"""
+
+    async def open_stream(self, payload, priority=None):
+        async def chunks():
+            yield {"response": "Python is", "done": False}
+            raise OllamaError(502, "upstream went away")
+        return chunks()
+
+
+def test_stream_that_fails_midway_reports_the_error_and_caches_nothing(monkeypatch):
+    monkeypatch.setattr(main, "answer_cache", AnswerCache(max_size=100, ttl=3600, db_path=""))
+    monkeypatch.setattr(main, "ollama", BrokenStreamOllama())
+    outcomes = []
+    monkeypatch.setattr(main, "observe_request",
+                        lambda route, outcome, *args, **kwargs: outcomes.append((route, outcome)))
+
+    response = TestClient(main.app).post("/ask", json={"question": "What is Python?", "stream": True})
+    events = [json.loads(line) for line in response.text.splitlines()]
+
+    assert events == [{"type": "token", "content": "Python is"},
+                      {"type": "error", "detail": "upstream went away"}]
+    assert outcomes == [("ollama", "error")]
+    assert not main.answer_cache.entries
@@ -0,0 +1,185 @@
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+try:
+    import numpy as np
+except ImportError:  # semantic retrieval is optional
+    np = None
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+EMBED_MODEL = os.getenv("RAG_EMBED_MODEL", "nomic-embed-text")
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "32"))
+EMBED_MAX_CHARS = 2000  # passages are truncated before embedding
+EMBED_TIMEOUT = 120.0
+
+# Reciprocal rank fusion constant for hybrid keyword + semantic ranking
+RRF_K = 60
+
+
+def semantic_available() -> bool:
+    return np is not None
+
+
+class OllamaEmbedder:
+    """Embeds text with a local Ollama embedding model (fully offline)"""
+
+    def __init__(self, model: str = EMBED_MODEL, base_url: str = OLLAMA_URL):
+        self.model = model
+        self.client = httpx.Client(base_url=base_url, timeout=EMBED_TIMEOUT)
+        self.batch_endpoint = True
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if self.batch_endpoint:
+            response = self.client.post("/api/embed", json={"model": self.model, "input": texts})
+            if response.status_code != 404:
+                response.raise_for_status()
+                return response.json()["embeddings"]
+            # Older Ollama releases only have the single-prompt endpoint
+            self.batch_endpoint = False
+
+        vectors = []
+        for text in texts:
+            response = self.client.post("/api/embeddings", json={"model": self.model, "prompt": text})
+            response.raise_for_status()
+            vectors.append(response.json()["embedding"])
+        return vectors
+
+    def close(self):
+        self.client.close()
+
+
+class VectorIndex:
+    """
+    Passage embeddings in one contiguous, L2-normalized float32 matrix.
+
+    The matrix is saved as .npy next to the keyword snapshot and memory-mapped
+    on load; a search is a single matrix-vector product plus argpartition.
+    """
+
+    def __init__(self, vectors, passage_docs, model: str):
+        self.vectors = vectors
+        self.passage_docs = passage_docs
+        self.model = model
+
+    @staticmethod
+    def paths(snapshot_path: str) -> Tuple[str, str]:
+        base = os.path.splitext(snapshot_path)[0]
+        return f"{base}.vectors.npy", f"{base}.vectors.json"
+
+    @staticmethod
+    def passage_doc_ids(book_index):
+        """Map every passage id to its chapter's doc id"""
+        offsets = np.asarray(book_index.doc_passage_offsets, dtype=np.int64)
+        passage_ids = np.arange(len(book_index.passage_lengths))
+        return np.searchsorted(offsets, passage_ids, side='right') - 1
+
+    @classmethod
+    def load(cls, snapshot_path: str, sources: List[List], model: str, book_index) -> Optional["VectorIndex"]:
+        vectors_path, meta_path = cls.paths(snapshot_path)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        passage_count = len(book_index.passage_lengths)
+        if meta.get('sources') != sources or meta.get('model') != model or meta.get('count') != passage_count:
+            return None
+        try:
+            vectors = np.load(vectors_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        return cls(vectors, cls.passage_doc_ids(book_index), model)
+
+    @staticmethod
+    def embed_passages(embedder: OllamaEmbedder, book_index, start: int, end: int):
+        """L2-normalized embeddings of passages [start, end) as a float32 matrix"""
+        rows = []
+        for batch_start in range(start, end, EMBED_BATCH_SIZE):
+            batch = [
+                book_index.passage_text(passage_id)[:EMBED_MAX_CHARS]
+                for passage_id in range(batch_start, min(batch_start + EMBED_BATCH_SIZE, end))
+            ]
+            rows.extend(embedder.embed(batch))
+
+        vectors = np.asarray(rows, dtype=np.float32).reshape(end - start, -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.maximum(norms, 1e-12)
+        return vectors
+
+    @classmethod
+    def save(cls, snapshot_path: str, sources: List[List], model: str, vectors, book_index) -> "VectorIndex":
+        """Write the matrix next to the keyword snapshot and memory-map it back"""
+        vectors_path, meta_path = cls.paths(snapshot_path)
+        os.makedirs(os.path.dirname(vectors_path) or '.', exist_ok=True)
+        tmp_path = f"{vectors_path}.tmp.{os.getpid()}.npy"
+        np.save(tmp_path, vectors)
+        os.replace(tmp_path, vectors_path)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'sources': sources, 'model': model, 'count': len(vectors),
+                       'dim': int(vectors.shape[1]) if len(vectors) else 0}, f)
+
+        return cls(np.load(vectors_path, mmap_mode='r'), cls.passage_doc_ids(book_index), model)
+
+    @classmethod
+    def build(cls, snapshot_path: str, sources: List[List], embedder: OllamaEmbedder, book_index) -> "VectorIndex":
+        passage_count = len(book_index.passage_lengths)
+        logger.info(f"Embedding {passage_count} passages with {embedder.model}...")
+        vectors = cls.embed_passages(embedder, book_index, 0, passage_count)
+        return cls.save(snapshot_path, sources, embedder.model, vectors, book_index)
+
+    def updated(self, snapshot_path: str, sources: List[List], embedder: OllamaEmbedder,
+                old_index, kept_doc_ids: List[int], book_index) -> "VectorIndex":
+        """
+        Vectors for an index produced by `old_index.updated(...)`.
+
+        Rows of the kept chapters are copied over; only the passages of the
+        added chapters (which follow them) are embedded.
+        """
+        reused = [self.vectors[old_index.doc_passage_offsets[doc_id]:old_index.doc_passage_offsets[doc_id + 1]]
+                  for doc_id in kept_doc_ids]
+        reused_count = sum(len(rows) for rows in reused)
+        passage_count = len(book_index.passage_lengths)
+        if passage_count > reused_count:
+            logger.info(f"Embedding {passage_count - reused_count} new passages with {embedder.model}...")
+            reused.append(self.embed_passages(embedder, book_index, reused_count, passage_count))
+        vectors = np.concatenate(reused).astype(np.float32, copy=False)
+        return self.save(snapshot_path, sources, embedder.model, vectors, book_index)
+
+    def search_passages(self, query_vector: List[float], top_k: int) -> List[Tuple[int, float]]:
+        """Top-k (passage_id, cosine similarity) pairs, best first"""
+        if not len(self.vectors):
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.vectors @ query
+        top_k = min(top_k, len(scores))
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        ordered = candidates[np.argsort(-scores[candidates])]
+        return [(int(passage_id), float(scores[passage_id])) for passage_id in ordered]
+
+    def search_chapters(self, query_vector: List[float], top_k: int,
+                        passage_pool: int = 200) -> List[Tuple[int, float, int]]:
+        """Rank chapters by their best passage: (doc_id, score, passage_id)"""
+        best: Dict[int, Tuple[float, int]] = {}
+        for passage_id, score in self.search_passages(query_vector, passage_pool):
+            doc_id = int(self.passage_docs[passage_id])
+            if doc_id not in best:
+                best[doc_id] = (score, passage_id)
+        ranked = sorted(best.items(), key=lambda item: item[1][0], reverse=True)[:top_k]
+        return [(doc_id, score, passage_id) for doc_id, (score, passage_id) in ranked]
+
+
+def reciprocal_rank_fusion(*rankings: List[int]) -> Dict[int, float]:
+    """Fuse several best-first id lists into one score per id"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return fused
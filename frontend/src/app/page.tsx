@@ -17,6 +17,7 @@ export default function Home() {
   const [recentQuestions, setRecentQuestions] = useState<Question[]>([]);
   const [error, setError] = useState('');
   const [useRAG, setUseRAG] = useState(false);
+  const [augment, setAugment] = useState(false);
 
   // Load recent questions from localStorage
   useEffect(() => {
@@ -48,6 +49,44 @@ export default function Home() {
     localStorage.setItem('askAfrica_recent_questions', JSON.stringify(updated));
   };
 
+  // Consume the NDJSON event stream from /ask, rendering tokens as they arrive
+  const readAnswerStream = async (response: Response) => {
+    if (!response.body) {
+      throw new Error('Streaming is not supported by this browser');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let fullAnswer = '';
+    let source = useRAG ? (augment ? 'rag_llm' : 'book_rag') : 'ollama';
+
+    const handleLine = (line: string) => {
+      if (!line.trim()) return;
+      const event = JSON.parse(line);
+      if (event.type === 'token') {
+        fullAnswer += event.content;
+        setAnswer(fullAnswer);
+      } else if (event.type === 'done') {
+        source = event.source;
+      } else if (event.type === 'error') {
+        throw new Error(event.detail);
+      }
+    };
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop() ?? '';
+      lines.forEach(handleLine);
+    }
+    handleLine(buffer + decoder.decode());
+
+    return { answer: fullAnswer, source };
+  };
+
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
     if (!question.trim()) return;
@@ -64,7 +103,9 @@ export default function Home() {
         },
         body: JSON.stringify({
           question: question.trim(),
-          use_rag: useRAG
+          use_rag: useRAG,
+          augment: useRAG && augment,
+          stream: true
         }),
       });
 
@@ -73,9 +114,8 @@ export default function Home() {
         throw new Error(errorData.detail || `HTTP error! status: ${response.status}`);
       }
 
-      const data = await response.json();
-      setAnswer(data.answer);
-      saveRecentQuestion(question.trim(), data.answer, data.source);
+      const { answer: fullAnswer, source } = await readAnswerStream(response);
+      saveRecentQuestion(question.trim(), fullAnswer, source);
       setQuestion('');
     } catch (err) {
       setError(err instanceof Error ? err.message : 'An error occurred');
@@ -122,6 +162,19 @@ export default function Home() {
                   📚 Search Python Crash Course Book
                 </span>
               </label>
+              {useRAG && (
+                <label className="flex items-center space-x-2 cursor-pointer">
+                  <input
+                    type="checkbox"
+                    checked={augment}
+                    onChange={(e) => setAugment(e.target.checked)}
+                    className="w-4 h-4 text-blue-600 bg-gray-100 border-gray-300 rounded focus:ring-blue-500 focus:ring-2"
+                  />
+                  <span className="text-sm font-medium text-gray-700">
+                    🤖 Answer with AI using the book
+                  </span>
+                </label>
+              )}
             </div>
 
             <div>
@@ -173,7 +226,7 @@ export default function Home() {
               <div className="flex items-center justify-between mb-2">
                 <h3 className="font-medium text-green-800">AI Response:</h3>
                 <span className="text-xs text-green-600 bg-green-100 px-2 py-1 rounded">
-                  {useRAG ? "📚 Book Search" : "🤖 General AI"}
+                  {useRAG ? (augment ? "📚🤖 Book + AI" : "📚 Book Search") : "🤖 General AI"}
                 </span>
               </div>
               <p className="text-green-700 whitespace-pre-wrap">{answer}</p>
@@ -198,11 +251,11 @@ export default function Home() {
                     <div className="flex items-center space-x-2">
                       <span className="text-xs text-gray-500">{formatTime(q.timestamp)}</span>
                       <span className={`text-xs px-2 py-1 rounded ${
-                        q.source === 'book_rag' 
+                        q.source === 'book_rag' || q.source === 'rag_llm'
                           ? 'bg-blue-100 text-blue-600' 
                           : 'bg-gray-100 text-gray-600'
                       }`}>
-                        {q.source === 'book_rag' ? '📚 Book' : '🤖 AI'}
+                        {q.source === 'book_rag' ? '📚 Book' : q.source === 'rag_llm' ? '📚🤖 Book + AI' : '🤖 AI'}
                       </span>
                     </div>
                   </div>